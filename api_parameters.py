@@ -1,5 +1,35 @@
 # Access Token Expire Time
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
+STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES = 15
+
+
+# Principal cache used by get_current_user
+PRINCIPAL_CACHE_SIZE = 10000
+PRINCIPAL_CACHE_TTL_SECONDS = 60
+
+# Verified JWT cache, entries expire with the token
+VERIFIED_TOKEN_CACHE_SIZE = 10000
+
+
+# Keyset pagination of list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Row counts behind approximate page totals
+TOTAL_COUNT_CACHE_SIZE = 64
+TOTAL_COUNT_CACHE_TTL_SECONDS = 300
+
+
+# Reference data (roles, groups, commodity groups, licenses) reload interval
+REFERENCE_DATA_TTL_SECONDS = 300
+
+# LISTEN/NOTIFY channel that carries cache invalidations between workers
+INVALIDATION_CHANNEL = "yhat_cache_invalidation"
+
+
+# Query result cache, opt-in per query with execute_query(..., cache=True)
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_TTL_SECONDS = 60
 
 
 # Database Schema & Tables
@@ -19,11 +49,21 @@ TABLE_MODEL_METRIC = "yt_model_metric"
 TABLE_MODEL_METRIC_TYPE = "yt_model_metric_type"
 TABLE_MODEL_STATUS = "yt_model_status"
 TABLE_PEAK_HOURS = "yt_peak_hours"
+TABLE_PRINCIPAL_REVISION = "yt_principal_revision"
 TABLE_ROLE = "yt_role"
 TABLE_SEASONS = "yt_seasons"
 TABLE_USER = "yt_user"
 TABLE_USER_SYSTEM_DESCRIPTION = "yt_user_system_description"
 
 
+# Cached reads of these tables live longer, they only change when models are reloaded.
+# Forecasts are rewritten by the loading pipeline outside the API, so their reads are never cached.
+QUERY_CACHE_TABLE_TTL_SECONDS = {
+    TABLE_ASSIGN_MODEL: 600,
+    TABLE_MODEL: 600,
+    TABLE_MODEL_METRIC_TYPE: 3600,
+}
+
+
 # AWS S3
 S3_BUCKET = "yhat"
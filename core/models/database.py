@@ -13,6 +13,7 @@ from sqlalchemy import (
     )
 
 # Importing from project files
+from api_parameters import QUERY_CACHE_MAX_BYTES, QUERY_CACHE_TABLE_TTL_SECONDS, QUERY_CACHE_TTL_SECONDS
 from core.models import db
 
 
@@ -27,10 +28,25 @@ password = env("PASSWORD")
 host = env("HOST")
 dbname = env("DBNAME")
 port = env("PORT")
+# Statements taking this many seconds or more are logged, 0 turns the slow query log off
+slow_query_seconds = env.float("SLOW_QUERY_SECONDS", 1.0)
+# Connection pool size and admission control
+db_pool_min_size = env.int("DB_POOL_MIN_SIZE", 1)
+db_pool_max_size = env.int("DB_POOL_MAX_SIZE", 20)
+db_acquire_timeout = env.float("DB_ACQUIRE_TIMEOUT_SECONDS", 10)
+db_max_waiters = env.int("DB_MAX_WAITERS", 100)
 
 # Database connection
 metadata = MetaData()
-database = db.Database(user, password, host, dbname, port)
+database = db.Database(user, password, host, dbname, port,
+                       result_cache_max_bytes=QUERY_CACHE_MAX_BYTES,
+                       result_cache_ttl=QUERY_CACHE_TTL_SECONDS,
+                       result_cache_table_ttls=QUERY_CACHE_TABLE_TTL_SECONDS,
+                       slow_query_seconds=slow_query_seconds,
+                       min_pool_size=db_pool_min_size,
+                       max_pool_size=db_pool_max_size,
+                       acquire_timeout=db_acquire_timeout,
+                       max_waiters=db_max_waiters)
 
 
 # Commodity table
@@ -127,3 +143,13 @@ UserSystemDescription = Table(
         Column("created_at", DateTime),
         Column("updated_at", DateTime)
 )
+
+
+# PrincipalRevision table, a row per revocation of stateless tokens, principal_id 0 revokes every principal
+PrincipalRevision = Table(
+        "yt_principal_revision",
+        metadata,
+        Column("principal_id", Integer, nullable=False),
+        Column("revision", Integer, nullable=False),
+        Column("created_at", DateTime)
+)
@@ -1,6 +1,16 @@
 # Importing Python packages
+import asyncio
 import asyncpg
+import bisect
+import hashlib
 import logging
+import numpy as np
+import re
+import sys
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
 
 logger = logging.getLogger('foo-logger')
@@ -9,32 +19,389 @@ logger = logging.getLogger('foo-logger')
 # ----------------------------------------------------------------------------------------------------
 
 
+class PreparedConnection(asyncpg.Connection):
+    """
+    asyncpg connection that keeps its prepared statements in an LRU keyed by SQL text,
+    so repeated statements are parsed and planned once per connection.
+    The LRU size is set per connection by the pool `init`, see Database.connect.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statement_cache_size = 256
+        self._prepared_statements = OrderedDict()
+
+
+    # Get prepared statement from cache or prepare it
+    async def get_prepared(self, query: str):
+        statement = self._prepared_statements.get(query)
+        if statement is not None:
+            self._prepared_statements.move_to_end(query)
+            return statement
+
+        statement = await self.prepare(query)
+        self._prepared_statements[query] = statement
+        if len(self._prepared_statements) > self.statement_cache_size:
+            self._prepared_statements.popitem(last=False)
+        return statement
+
+
+    # Fetch rows through the prepared statement cache
+    async def fetch_prepared(self, query: str, *args):
+        _, records = await self._fetch_statement(query, *args)
+        return records
+
+
+    # Fetch rows and the column names of the result
+    async def fetch_named_prepared(self, query: str, *args):
+        statement, records = await self._fetch_statement(query, *args)
+        return records, [attribute.name for attribute in statement.get_attributes()]
+
+
+    async def _fetch_statement(self, query: str, *args):
+        statement = await self.get_prepared(query)
+        try:
+            return statement, await statement.fetch(*args)
+        except asyncpg.exceptions.InvalidCachedStatementError:
+            # Schema changed under the cached plan, prepare it again once
+            self._prepared_statements.pop(query, None)
+            statement = await self.get_prepared(query)
+            return statement, await statement.fetch(*args)
+
+
+    # Fetch rows as contiguous arrays, one per column
+    async def fetch_columns_prepared(self, query: str, *args, dtype=np.float64):
+        records, names = await self.fetch_named_prepared(query, *args)
+        return records_to_columns(records, names, dtype)
+
+
+def records_to_columns(records: list, names: list, dtype=np.float64):
+    # zip transposes the records in C instead of a Python loop per column
+    values = zip(*records) if records else [()] * len(names)
+    return {name: np.array(column, dtype=dtype) for name, column in zip(names, values)}
+
+
+class SingleFlight:
+    """
+    Lets concurrent calls with the same key share one execution and its result.
+    The execution runs as its own task, so a cancelled caller does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.shared = 0
+        self._calls = {}
+
+
+    # `copy` is applied to the result handed to callers that joined a running execution
+    async def run(self, key, func, *args, copy=None, **kwargs):
+        try:
+            task = self._calls.get(key)
+        except TypeError:
+            # Unhashable arguments, nothing to share
+            return await func(*args, **kwargs)
+
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is task else None)
+            return await asyncio.shield(task)
+
+        self.shared += 1
+        result = await asyncio.shield(task)
+        return copy(result) if copy else result
+
+
+    def stats(self):
+        calls = self.executions + self.shared
+        return {"in_flight": len(self._calls), "executions": self.executions, "shared": self.shared,
+                "shared_rate": self.shared / calls if calls else 0.0}
+
+
+# Reads are the only statements safe to share between callers
+def is_read_query(query: str):
+    return query.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+# Callers that share a result get their own row dictionaries
+def copy_rows(rows: list):
+    return None if rows is None else [dict(row) for row in rows]
+
+
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+([\w."]+)', re.IGNORECASE)
+
+
+# Tables a statement reads or writes, without schema, e.g. {"yt_model", "yt_assign_model"}
+@lru_cache(maxsize=2048)
+def query_tables(query: str):
+    return frozenset(name.replace('"', '').split(".")[-1].lower() for name in TABLE_REFERENCE.findall(query))
+
+
+# Same statement written with different whitespace or a trailing semicolon gets the same text
+def normalize_query(query: str):
+    return " ".join(query.split()).rstrip(";").rstrip()
+
+
+# Values bound per IN (...) list, Redshift has no array parameters for ANY($1)
+IN_LIST_SIZE = 1024
+
+
+# "$1, $2, ..." for `count` bind parameters starting at $start
+def placeholders(count: int, start: int = 1):
+    return ", ".join(f"${index}" for index in range(start, start + count))
+
+
+# Split values into lists of at most `size`, each padded to a power of two by repeating its last value,
+# so a handful of statement shapes are prepared instead of one per list length
+def in_lists(values, size: int = IN_LIST_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        chunk = values[start:start + size]
+        width = 1 << (len(chunk) - 1).bit_length()
+        yield chunk + [chunk[-1]] * (width - len(chunk))
+
+
+# Rough memory held by a list of row dictionaries
+def estimate_size(rows: list):
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+    return size
+
+
+class QueryResultCache:
+    """
+    LRU cache of read results bounded by their estimated size in bytes.
+    An entry lives for the smallest TTL of the tables it reads (`table_ttls`, else `ttl`),
+    and is dropped as soon as a write to one of those tables goes through Database.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, table_ttls: dict = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.table_ttls = table_ttls or {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # key -> (expires_at, size, tables, rows)
+        self._entries = OrderedDict()
+        self._keys_by_table = {}
+        # Bumped on every write to the table, a read that overlapped a write is not stored
+        self._generations = {}
+
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[3]
+
+
+    def generation(self, tables: set):
+        return tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+
+    # Store rows read while the tables were at `generation`
+    def set(self, key, rows: list, tables: set, generation: tuple):
+        if not tables or generation != self.generation(tables):
+            return
+        size = estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = min(self.table_ttls.get(table, self.ttl) for table in tables)
+        self._entries[key] = (time.monotonic() + ttl, size, tables, rows)
+        self.bytes += size
+        for table in tables:
+            self._keys_by_table.setdefault(table, set()).add(key)
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+
+    def invalidate_tables(self, tables):
+        for table in tables:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            for key in list(self._keys_by_table.get(table, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+
+    def _remove(self, key):
+        _, size, tables, _ = self._entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table]
+
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations}
+
+
+class PoolBusyError(Exception):
+    pass
+
+
+QUOTED_LITERAL = re.compile(r"'(?:[^']|'')*'")
+# Bind parameters like $1 and digits inside names are not literals
+NUMBER_LITERAL = re.compile(r"(?<![$\w])\d+(?:\.\d+)?\b")
+
+
+# Statement text with literals replaced by ?, and a short id for it.
+# Statements that only differ in inlined values share a fingerprint.
+@lru_cache(maxsize=2048)
+def fingerprint(query: str):
+    text = NUMBER_LITERAL.sub("?", QUOTED_LITERAL.sub("?", normalize_query(query)))
+    return hashlib.sha1(text.encode()).hexdigest()[:12], text
+
+
+class QueryStats:
+    """
+    Latency of every statement aggregated per fingerprint: calls, rows, errors, seconds spent
+    waiting for a pool connection, executing and decoding rows, and a histogram of total latency.
+    Statements that take `slow_query_seconds` or longer are logged. At most `max_statements`
+    fingerprints are tracked, the rest are added up under "other".
+    """
+
+    # Upper bounds of the latency histogram buckets in seconds, the last bucket is unbounded
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+    def __init__(self, slow_query_seconds: float = 1.0, max_statements: int = 500):
+        self.slow_query_seconds = slow_query_seconds
+        self.max_statements = max_statements
+        self.slow_queries = 0
+        self._statements = {}
+
+
+    def record(self, query: str, acquire: float, execute: float, decode: float, rows: int, error: bool = False):
+        statement_id, text = fingerprint(query)
+        stats = self._statements.get(statement_id)
+        if stats is None:
+            if len(self._statements) >= self.max_statements:
+                statement_id, text = "other", "other"
+                stats = self._statements.get(statement_id)
+            if stats is None:
+                stats = self._statements[statement_id] = {
+                    "fingerprint": statement_id, "query": text, "calls": 0, "rows": 0, "errors": 0,
+                    "acquire_seconds": 0.0, "execute_seconds": 0.0, "decode_seconds": 0.0, "total_seconds": 0.0,
+                    "max_seconds": 0.0, "histogram": [0] * len(self.BUCKETS)}
+
+        total = acquire + execute + decode
+        stats["calls"] += 1
+        stats["rows"] += rows
+        stats["errors"] += error
+        stats["acquire_seconds"] += acquire
+        stats["execute_seconds"] += execute
+        stats["decode_seconds"] += decode
+        stats["total_seconds"] += total
+        stats["max_seconds"] = max(stats["max_seconds"], total)
+        stats["histogram"][bisect.bisect_left(self.BUCKETS, total)] += 1
+
+        if self.slow_query_seconds and total >= self.slow_query_seconds:
+            self.slow_queries += 1
+            logger.warning(f"Slow query {statement_id}: {total:.3f}s (acquire {acquire:.3f}s, execute {execute:.3f}s, "
+                           f"decode {decode:.3f}s), {rows} rows{', failed' if error else ''}: {text[:500]}")
+
+
+    # Upper bound of the bucket that holds the q-th quantile
+    def _percentile(self, histogram: list, calls: int, q: float, max_seconds: float):
+        threshold, seen = q * calls, 0
+        for bound, count in zip(self.BUCKETS, histogram):
+            seen += count
+            if seen >= threshold:
+                return min(bound, max_seconds)
+        return max_seconds
+
+
+    # Statements with the largest `sort_by` first
+    def top(self, limit: int = 20, sort_by: str = "total_seconds"):
+        statements = sorted(self._statements.values(), key=lambda stats: stats[sort_by], reverse=True)[:limit]
+        return [{**stats,
+                 "mean_seconds": stats["total_seconds"] / stats["calls"],
+                 "p50_seconds": self._percentile(stats["histogram"], stats["calls"], 0.50, stats["max_seconds"]),
+                 "p95_seconds": self._percentile(stats["histogram"], stats["calls"], 0.95, stats["max_seconds"]),
+                 "p99_seconds": self._percentile(stats["histogram"], stats["calls"], 0.99, stats["max_seconds"]),
+                 "histogram": dict(zip(map(str, self.BUCKETS), stats["histogram"]))}
+                for stats in statements]
+
+
+    def reset(self):
+        self._statements.clear()
+        self.slow_queries = 0
+
+
 class Database:
-    def __init__(self, user, password, host, database, port):
+    def __init__(self, user, password, host, database, port, statement_cache_size=256, fetch_batch_size=1000,
+                 single_flight=True, concurrent_timeout=60, result_cache_max_bytes=64 * 1024 * 1024,
+                 result_cache_ttl=60, result_cache_table_ttls=None, slow_query_seconds=1.0, min_pool_size=1,
+                 max_pool_size=20, acquire_timeout=10, max_waiters=100):
         self.user = user
         self.password = password
         self.host = host
         self.port = port
         self.database = database
+        self.statement_cache_size = statement_cache_size
+        self.fetch_batch_size = fetch_batch_size
         self._cursor = None
+        self._copy_supported = True
+        # Concurrent identical reads share one execution
+        self.single_flight = single_flight
+        self._in_flight = SingleFlight()
+        self.concurrent_timeout = concurrent_timeout
+        # Opt-in with execute_query(..., cache=True)
+        self.result_cache = QueryResultCache(result_cache_max_bytes, result_cache_ttl, result_cache_table_ttls)
+        # listener(tables) runs after every invalidation, e.g. to tell other workers
+        self.write_listeners = []
+        self.query_stats = QueryStats(slow_query_seconds)
+        # Pool admission control, at most `max_waiters` callers wait up to `acquire_timeout` seconds for a connection
+        self.min_pool_size = min_pool_size
+        self.max_pool_size = max_pool_size
+        self.acquire_timeout = acquire_timeout
+        self.max_waiters = max_waiters
+        self.waiters = 0
+        self.in_use = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._acquire_seconds = deque(maxlen=1024)
 
         self._connection_pool = None
-    
+        self._listen_connection = None
+
 
     # Connect to postgres db
     async def connect(self):
         if not self._connection_pool:
             try:
                 self._connection_pool = await asyncpg.create_pool(
-                    min_size=1,
-                    max_size=20,
+                    min_size=self.min_pool_size,
+                    max_size=self.max_pool_size,
                     command_timeout=60,
                     host=self.host,
                     port=self.port,
                     user=self.user,
                     password=self.password,
                     database=self.database,
-                    ssl="require"
+                    ssl="require",
+                    connection_class=PreparedConnection,
+                    init=self._init_connection,
+                    # Statements are cached by PreparedConnection, con.fetch() runs unnamed statements
+                    statement_cache_size=0
                 )
                 logger.info("Database pool connection opened")
 
@@ -42,25 +409,407 @@ class Database:
                 logger.exception(e)
 
 
-    # Execute query
-    async def execute_query(self, query: str, *args):
+    async def _init_connection(self, con):
+        con.statement_cache_size = self.statement_cache_size
+
+
+    # Acquire a pool connection, raises PoolBusyError when too many callers are already waiting
+    # or no connection frees up within acquire_timeout
+    async def _acquire(self):
+        if self.waiters >= self.max_waiters:
+            self.rejected += 1
+            raise PoolBusyError("Too many requests waiting for a database connection")
+
+        self.waiters += 1
+        started = time.perf_counter()
+        try:
+            con = await self._connection_pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolBusyError(f"No database connection free within {self.acquire_timeout}s")
+        finally:
+            self.waiters -= 1
+            self._acquire_seconds.append(time.perf_counter() - started)
+        self.in_use += 1
+        return con
+
+
+    async def _release(self, con):
+        self.in_use -= 1
+        await self._connection_pool.release(con)
+
+
+    # Admission control, new requests are turned away while the waiter queue is full
+    def pool_saturated(self):
+        return self.waiters >= self.max_waiters
+
+
+    # Drop the cached reads of tables that were written
+    def invalidate_tables(self, tables):
+        if not tables:
+            return
+        self.result_cache.invalidate_tables(tables)
+        for listener in self.write_listeners:
+            try:
+                listener(tables)
+            except Exception as e:
+                logger.exception(e)
+
+
+    # Reads shared by concurrent callers of execute_query
+    def flight_stats(self):
+        return self._in_flight.stats()
+
+
+    def pool_stats(self):
+        latencies = np.array(self._acquire_seconds) if self._acquire_seconds else np.zeros(1)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {"size": self._connection_pool.get_size() if self._connection_pool else 0,
+                "max_size": self.max_pool_size, "in_use": self.in_use,
+                "idle": self._connection_pool.get_idle_size() if self._connection_pool else 0,
+                "waiters": self.waiters, "max_waiters": self.max_waiters, "acquire_timeout": self.acquire_timeout,
+                "rejected": self.rejected, "timeouts": self.timeouts,
+                "acquire_p50_seconds": float(p50), "acquire_p95_seconds": float(p95),
+                "acquire_p99_seconds": float(p99)}
+
+
+    # Execute query, args are bound to $1, $2, ... placeholders
+    # cache=True serves a read from the result cache, writes always drop the cached reads of their table
+    async def execute_query(self, query: str, *args, cache: bool = False):
+        if not is_read_query(query):
+            try:
+                return await self._execute_query(query, *args)
+            finally:
+                self.invalidate_tables(query_tables(query))
+
+        if not cache:
+            return await self._read_query(query, *args)
+
+        # List arguments become tuples so they can be part of the key
+        key = (normalize_query(query), tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args))
+        try:
+            rows = self.result_cache.get(key)
+        except TypeError:
+            return await self._read_query(query, *args)
+        if rows is not None:
+            return copy_rows(rows)
+
+        tables = query_tables(query)
+        generation = self.result_cache.generation(tables)
+        rows = await self._read_query(query, *args)
+        if rows is not None:
+            self.result_cache.set(key, copy_rows(rows), tables, generation)
+        return rows
+
+
+    async def _read_query(self, query: str, *args):
+        if self.single_flight:
+            # Writes bump the generation of their tables, a read issued after a write starts its own execution
+            key = (query, args, self.result_cache.generation(query_tables(query)))
+            return await self._in_flight.run(key, self._execute_query, query, *args, copy=copy_rows)
+        return await self._execute_query(query, *args)
+
+
+    async def _execute_query(self, query: str, *args):
         if not self._connection_pool:
             await self.connect()
         else:
-            con = await self._connection_pool.acquire()
+            started = time.perf_counter()
+            con = await self._acquire()
+            acquired = time.perf_counter()
             try:
-                result = await con.fetch(query, *args)
+                result = await con.fetch_prepared(query, *args)
+                executed = time.perf_counter()
                 # Convert records to list of dictionaries
                 values = [dict(record) for record in result]
+                self.query_stats.record(query, acquired - started, executed - acquired,
+                                        time.perf_counter() - executed, len(values))
                 return values
+            except Exception as e:
+                self.query_stats.record(query, acquired - started, time.perf_counter() - acquired, 0.0, 0, error=True)
+                logger.exception(e)
+            finally:
+                await self._release(con)
+
+
+    # Run independent queries at the same time, each on its own pool connection.
+    # Every query is a tuple (query, *args), results come back in the same order, None for a failed query.
+    # If `timeout` seconds pass, all of them are cancelled and asyncio.TimeoutError is raised.
+    async def execute_concurrently(self, *queries, timeout: float = None, cache: bool = False):
+        if not self._connection_pool:
+            await self.connect()
+        tasks = [asyncio.ensure_future(self.execute_query(query, *args, cache=cache)) for query, *args in queries]
+        try:
+            return await asyncio.wait_for(asyncio.gather(*tasks), timeout or self.concurrent_timeout)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+    # Execute query and return {column: numpy array}, NULLs become NaN for float dtypes.
+    # `decode` runs the conversion off the event loop, e.g. analytics_executor.run_thread, it is awaited as
+    # decode(records_to_columns, records, names, dtype) once the connection is back in the pool.
+    async def fetch_columns(self, query: str, *args, dtype=np.float64, decode=None):
+        if not self._connection_pool:
+            await self.connect()
+        else:
+            started = time.perf_counter()
+            con = await self._acquire()
+            acquired = time.perf_counter()
+            try:
+                try:
+                    records, names = await con.fetch_named_prepared(query, *args)
+                finally:
+                    await self._release(con)
+                executed = time.perf_counter()
+                if decode is None:
+                    columns = records_to_columns(records, names, dtype)
+                else:
+                    columns = await decode(records_to_columns, records, names, dtype)
+                self.query_stats.record(query, acquired - started, executed - acquired,
+                                        time.perf_counter() - executed, len(records))
+                return columns
+            except Exception as e:
+                self.query_stats.record(query, acquired - started, time.perf_counter() - acquired, 0.0, 0, error=True)
+                logger.exception(e)
+
+
+    # Run a read once per IN list of `values` and return the rows of all of them.
+    # build_query(in_list) returns the statement for one list, e.g. f"... WHERE id IN ({in_list})",
+    # the list is bound after `args`. None when one of the reads failed.
+    # With `con` from transaction() the reads run in that transaction and errors are raised.
+    async def execute_in_list(self, build_query, values, *args, cache: bool = False, con=None):
+        rows = []
+        for chunk in in_lists(values):
+            query = build_query(placeholders(len(chunk), len(args) + 1))
+            if con is not None:
+                result = await self.execute_in_transaction(con, query, *args, *chunk)
+            else:
+                result = await self.execute_query(query, *args, *chunk, cache=cache)
+            if result is None:
+                return None
+            rows.extend(result)
+        return rows
+
+
+    # fetch_columns over IN lists of `values`, see execute_in_list, the arrays of all lists are concatenated
+    async def fetch_columns_in_list(self, build_query, values, *args, dtype=np.float64, decode=None):
+        parts = []
+        for chunk in in_lists(values):
+            columns = await self.fetch_columns(build_query(placeholders(len(chunk), len(args) + 1)), *args, *chunk,
+                                               dtype=dtype, decode=decode)
+            if columns is None:
+                return None
+            parts.append(columns)
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]} if parts else {}
+
+
+    # Acquire one connection and run a transaction on it, the connection is yielded to the caller.
+    # Run statements on it with execute_in_transaction and insert_many(..., con=con), the tables they
+    # write are invalidated once the transaction commits.
+    @asynccontextmanager
+    async def transaction(self):
+        if not self._connection_pool:
+            await self.connect()
+        con = await self._acquire()
+        con.written_tables = set()
+        try:
+            async with con.transaction():
+                yield con
+            self.invalidate_tables(con.written_tables)
+        finally:
+            con.written_tables = None
+            await self._release(con)
+
+
+    # Execute query on a connection from transaction() and return a list of dictionaries.
+    # Recorded in query_stats like execute_query, errors are raised so the transaction rolls back.
+    async def execute_in_transaction(self, con, query: str, *args):
+        started = time.perf_counter()
+        try:
+            result = await con.fetch_prepared(query, *args)
+        except Exception:
+            self.query_stats.record(query, 0.0, time.perf_counter() - started, 0.0, 0, error=True)
+            raise
+        executed = time.perf_counter()
+        values = [dict(record) for record in result]
+        self.query_stats.record(query, 0.0, executed - started, time.perf_counter() - executed, len(values))
+        if not is_read_query(query):
+            con.written_tables |= query_tables(query)
+        return values
+
+
+    # Stream query result in batches of dictionaries through a server-side cursor:
+    #   async with database.stream_query(query, *args) as batches:
+    #       async for batch in batches: ...
+    # The connection and its transaction are released when the block exits, also when the consumer stops early
+    # The whole stream is recorded in query_stats as one statement once the block exits.
+    @asynccontextmanager
+    async def stream_query(self, query: str, *args, batch_size: int = None):
+        if not self._connection_pool:
+            await self.connect()
+        started = time.perf_counter()
+        con = await self._acquire()
+        stream = {"acquire": time.perf_counter() - started, "execute": 0.0, "decode": 0.0, "rows": 0, "error": False}
+        try:
+            # Cursors only live inside a transaction
+            async with con.transaction():
+                opened = time.perf_counter()
+                try:
+                    statement = await con.get_prepared(query)
+                    cursor = await statement.cursor(*args)
+                except Exception:
+                    stream["error"] = True
+                    raise
+                finally:
+                    stream["execute"] += time.perf_counter() - opened
+                yield self._batches(cursor, batch_size or self.fetch_batch_size, stream)
+        finally:
+            self.query_stats.record(query, stream["acquire"], stream["execute"], stream["decode"], stream["rows"],
+                                    error=stream["error"])
+            await self._release(con)
+
+
+    # Batches of a cursor, fetch and decode time and rows are added up in `stream`
+    async def _batches(self, cursor, batch_size: int, stream: dict):
+        while True:
+            started = time.perf_counter()
+            try:
+                records = await cursor.fetch(batch_size)
+            except Exception:
+                stream["error"] = True
+                raise
+            finally:
+                stream["execute"] += time.perf_counter() - started
+            if not records:
+                break
+            decoding = time.perf_counter()
+            batch = [dict(record) for record in records]
+            stream["decode"] += time.perf_counter() - decoding
+            stream["rows"] += len(batch)
+            yield batch
+
+
+    # Bulk insert records into a table, COPY when the server supports it, multi-row VALUES otherwise
+    # Pass `con` from Database.transaction() to make the insert part of that transaction, errors are raised then
+    async def insert_many(self, table: str, columns: list, records: list, schema: str = None, con=None):
+        if not records:
+            return 0
+        if con is not None:
+            con.written_tables.add(table)
+            return await self._insert_values(con, table, columns, records, schema)
+        if not self._connection_pool:
+            await self.connect()
+
+        started = time.perf_counter()
+        con = await self._acquire()
+        try:
+            return await self._insert_many(con, table, columns, records, schema, acquire=time.perf_counter() - started)
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            await self._release(con)
+            self.invalidate_tables([table])
+
+
+    # On a connection of its own, outside any transaction, so a rejected COPY leaves nothing to roll back
+    async def _insert_many(self, con, table: str, columns: list, records: list, schema: str = None,
+                           acquire: float = 0.0):
+        if self._copy_supported:
+            table_name = f"{schema}.{table}" if schema else table
+            try:
+                await self._recorded(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN",
+                                     con.copy_records_to_table(table, records=records, columns=columns,
+                                                               schema_name=schema),
+                                     len(records), acquire)
+                return len(records)
+            except (asyncpg.exceptions.FeatureNotSupportedError, asyncpg.exceptions.SyntaxOrAccessError) as e:
+                # Redshift does not accept COPY FROM STDIN, stop trying on this pool
+                logger.info(f"COPY not supported, falling back to multi-row insert: {e}")
+                self._copy_supported = False
+                acquire = 0.0
+
+        async with con.transaction():
+            return await self._insert_values(con, table, columns, records, schema, acquire)
+
+
+    # Multi-row VALUES inserts on the caller's connection and in its transaction, if any.
+    # No COPY and no savepoints here, Redshift supports neither.
+    async def _insert_values(self, con, table: str, columns: list, records: list, schema: str = None,
+                             acquire: float = 0.0):
+        table_name = f"{schema}.{table}" if schema else table
+        # Recorded under one text whatever the number of rows
+        label = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES (...)"
+        # Postgres protocol allows at most 32767 bind parameters per statement
+        rows_per_statement = max(1, 32767 // len(columns))
+        for start in range(0, len(records), rows_per_statement):
+            chunk = records[start:start + rows_per_statement]
+            values = ", ".join(
+                "(" + ", ".join(f"${row * len(columns) + col + 1}" for col in range(len(columns))) + ")"
+                for row in range(len(chunk))
+            )
+            query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES {values}"
+            # One statement per row count, not worth a slot in the prepared statement cache
+            await self._recorded(label, con.fetch(query, *[value for record in chunk for value in record]),
+                                 len(chunk), acquire)
+            acquire = 0.0
+        return len(records)
+
+
+    # Await a statement and record it in query_stats under `label`, errors are recorded and raised
+    async def _recorded(self, label: str, statement, rows: int, acquire: float = 0.0):
+        started = time.perf_counter()
+        try:
+            result = await statement
+        except Exception:
+            self.query_stats.record(label, acquire, time.perf_counter() - started, 0.0, 0, error=True)
+            raise
+        self.query_stats.record(label, acquire, time.perf_counter() - started, 0.0, rows)
+        return result
+
+
+    # Listen on a channel over one dedicated connection outside the pool,
+    # callback(connection, pid, channel, payload) runs on the event loop for every notification
+    async def listen(self, channel: str, callback):
+        if not self._listen_connection:
+            self._listen_connection = await asyncpg.connect(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                database=self.database,
+                ssl="require"
+            )
+        try:
+            await self._listen_connection.add_listener(channel, callback)
+        except Exception:
+            # Redshift accepts the connection but has no LISTEN, do not keep it open for nothing
+            await self.stop_listening()
+            raise
+        logger.info(f"Listening on channel {channel}")
+
+
+    # Publish a notification to every connection listening on the channel
+    async def notify(self, channel: str, payload: str):
+        # Not shared, every notification has to be sent
+        return await self._execute_query("SELECT pg_notify($1, $2);", channel, payload)
+
+
+    # Close the listening connection, every listener on it stops
+    async def stop_listening(self):
+        if self._listen_connection:
+            try:
+                await self._listen_connection.close()
+                logger.info("Listen connection closed")
             except Exception as e:
                 logger.exception(e)
             finally:
-                await self._connection_pool.release(con)
+                self._listen_connection = None
 
 
     # Close connection
     async def close(self):
+        await self.stop_listening()
         if not self._connection_pool:
             try:
                 await self._connection_pool.close()
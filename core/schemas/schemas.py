@@ -1,16 +1,28 @@
 # Importing Python packages
 import datetime
 from pydantic import BaseModel, Field
-from typing import List, Optional, Union
+from pydantic.generics import GenericModel
+from typing import Generic, List, Optional, TypeVar, Union
 
 
 # ----------------------------------------------------------------------------------------------------
 
 
-# Token Schema
-class TokenData(BaseModel):
-    name: Optional[str] = None
-    scopes: List[str] = []
+PageItem = TypeVar("PageItem")
+
+
+# Keyset pagination schema, pass next_cursor back as cursor to get the next page
+class KeysetPage(GenericModel, Generic[PageItem]):
+    items: List[PageItem]
+    size: int
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_is_exact: Optional[bool] = None
+
+
+# Error calculator schemas
+class ErrorBatchInSchema(BaseModel):
+    assign_model_ids: List[int] = Field(min_items=1)
 
 
 # Commodity schemas
@@ -177,7 +189,8 @@ class UserSchema(BaseModel):
     first_name: str
     last_name: str
     contact: Union[str, None] = None
-    email: str
+    # Left out of stateless tokens
+    email: Union[str, None] = None
     username: str
     company_name: Union[str, None] = None
     address: Union[str, None] = None
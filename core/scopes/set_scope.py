@@ -1,3 +1,10 @@
+# Importing Python packages
+from functools import lru_cache
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
 class Role:
     """
     Constants for the various roles scoped in the application ecosystem
@@ -39,3 +46,37 @@ class Role:
                        "Can add Manager Users."
                        "Can add new clients to the system – all user accounts need to be assigned to a Brand Signals client.",
     }
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+# Roles from lowest to highest, each role is granted its own scope and every scope below it
+ROLE_HIERARCHY = (Role.REPORTING_USER, Role.USER, Role.MANAGER, Role.ADMIN, Role.SUPER_ADMIN)
+
+# Compiled once at import: one bit per scope, and the mask of scopes each role is granted
+SCOPE_BITS = {role["name"]: 1 << index for index, role in enumerate(ROLE_HIERARCHY)}
+ROLE_GRANTS = {role["name"]: (1 << (index + 1)) - 1 for index, role in enumerate(ROLE_HIERARCHY)}
+
+# Bit no role is granted, so an unknown required scope is never satisfied
+UNKNOWN_SCOPE_BIT = 1 << len(ROLE_HIERARCHY)
+
+
+@lru_cache(maxsize=None)
+def scope_mask(scopes: tuple) -> int:
+    """
+    Mask of the scopes a route requires. Routes always pass the same scopes,
+    so this is computed once per route and served from the cache afterwards.
+    """
+    mask = 0
+    for scope in scopes:
+        mask |= SCOPE_BITS.get(scope, UNKNOWN_SCOPE_BIT)
+    return mask
+
+
+def role_mask(role_name: str) -> int:
+    return ROLE_GRANTS.get(str(role_name).upper(), 0)
+
+
+def is_authorized(granted_mask: int, required_mask: int) -> bool:
+    return required_mask & ~granted_mask == 0
@@ -1,4 +1,6 @@
 # Importing Python packages
+import hashlib
+import time
 from environs import Env
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
@@ -9,10 +11,14 @@ from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 
 # Importing from project files
-from api_parameters import ACCESS_TOKEN_EXPIRE_MINUTES , SCHEMA, TABLE_ROLE, TABLE_USER, TABLE_USER_SYSTEM_DESCRIPTION
+from api_parameters import ACCESS_TOKEN_EXPIRE_MINUTES , PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS, SCHEMA, \
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES, TABLE_PRINCIPAL_REVISION, TABLE_ROLE, TABLE_USER, TABLE_USER_SYSTEM_DESCRIPTION, \
+    VERIFIED_TOKEN_CACHE_SIZE
 from core.models.database import database
-from core.schemas.schemas import TokenData, UserSchema
-from core.scopes.set_scope import Role
+from core.schemas.schemas import UserSchema
+from core.scopes.set_scope import is_authorized, role_mask, scope_mask
+from internal.cache import TTLCache
+from internal.invalidation import invalidation_bus
 
 
 # ---------------------------------------------------------------------------------------------------
@@ -22,31 +28,151 @@ env = Env()
 env.read_env()
 SECRET_KEY = env("SECRET_KEY")
 ALGORITHM = env("ALGORITHM")
+# Stateless mode: log_in embeds the principal in the token and get_current_user trusts it without the database
+STATELESS_AUTH = env.bool("STATELESS_AUTH", False)
+# Bump to revoke every stateless token at once
+TOKEN_VERSION = env.int("TOKEN_VERSION", 1)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# User id -> user, role and system description row, and ("revisions", user id) -> revisions of stateless tokens,
+# invalidated by the user routers on writes
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+# sha256 of token -> decoded payload, so a token's signature is verified once until it expires
+verified_tokens = TTLCache(maxsize=VERIFIED_TOKEN_CACHE_SIZE, ttl=0)
+
+# Principal fields carried by a stateless token, the ids authorization needs and the required fields of UserSchema
+PRINCIPAL_CLAIMS = ("id", "first_name", "last_name", "username", "group_id", "role_id", "license_id", "role_name")
+
+# Revision counters for stateless tokens are rows of TABLE_PRINCIPAL_REVISION, shared by every worker and kept
+# across restarts, the largest revision of a principal is its current one. ALL_PRINCIPALS is the global counter.
+# A token is revoked once a counter moves past the revision it was issued with.
+ALL_PRINCIPALS = 0
+
+
+# The change was stored but the stateless tokens it affects could not be revoked
+class RevocationError(RuntimeError):
+    pass
+
 
 def create_access_token(data: dict, token_type: str):
     to_encode = data.copy()
     if token_type == "access":
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    elif token_type == "stateless":
+        expire = datetime.utcnow() + timedelta(minutes=STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def assign_scopes(scopes):
-    if Role.SUPER_ADMIN['name'] in scopes:
-        scopes = [Role.SUPER_ADMIN['name'], Role.ADMIN['name'], Role.MANAGER['name'], Role.USER['name'], Role.REPORTING_USER['name']]
-    elif Role.ADMIN['name'] in scopes:
-        scopes = [Role.ADMIN['name'], Role.MANAGER['name'], Role.USER['name'], Role.REPORTING_USER['name']]
-    elif Role.MANAGER['name'] in scopes:
-        scopes = [Role.MANAGER['name'], Role.USER['name'], Role.REPORTING_USER['name']]
-    elif Role.USER['name'] in scopes:
-        scopes = [Role.USER['name'], Role.REPORTING_USER['name']]
-    elif Role.REPORTING_USER['name'] in scopes:
-        scopes = [Role.REPORTING_USER['name']]
-    return scopes
+def decode_token(token: str):
+    token_key = hashlib.sha256(token.encode()).digest()
+    payload = verified_tokens.get(token_key)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        verified_tokens.set(token_key, payload, ttl=payload.get("exp", 0) - time.time())
+    return payload
+
+
+async def stateless_claims(principal: dict):
+    revisions = await principal_revisions(principal["id"])
+    if revisions is None:
+        raise RuntimeError(f"Could not read the token revisions of user {principal['id']}")
+    return {"mode": "stateless",
+            "ver": TOKEN_VERSION,
+            "rev": list(revisions),
+            "usr": {claim: principal.get(claim) for claim in PRINCIPAL_CLAIMS}}
+
+
+# (global revision, revision of the user), read through the principal cache, None when the read failed
+async def principal_revisions(user_id: int):
+    revisions = principal_cache.get(("revisions", user_id))
+    if revisions is None:
+        query = f"""SELECT principal_id, MAX(revision) AS revision
+                    FROM {SCHEMA}.{TABLE_PRINCIPAL_REVISION}
+                    WHERE principal_id IN ($1, $2)
+                    GROUP BY principal_id;
+                """
+        query_result = await database.execute_query(query, ALL_PRINCIPALS, user_id)
+        if query_result is None:
+            return None
+        revision_by_principal = {row["principal_id"]: row["revision"] for row in query_result}
+        revisions = (revision_by_principal.get(ALL_PRINCIPALS, 0), revision_by_principal.get(user_id, 0))
+        principal_cache.set(("revisions", user_id), revisions)
+    return revisions
+
+
+# Tokens are treated as revoked while their revisions cannot be read
+async def is_revoked(payload: dict):
+    if payload.get("ver") != TOKEN_VERSION:
+        return True
+    revisions = await principal_revisions(payload.get("id"))
+    if revisions is None:
+        return True
+    global_rev, user_rev = payload.get("rev", [-1, -1])
+    return global_rev < revisions[0] or user_rev < revisions[1]
+
+
+# Append a revision past the current one of the principal. Redshift has no upsert, so counters are insert only.
+async def bump_revision(principal_id: int):
+    query = f"""INSERT INTO {SCHEMA}.{TABLE_PRINCIPAL_REVISION} (principal_id, revision, created_at)
+                SELECT $1, COALESCE(MAX(revision), 0) + 1, $2
+                FROM {SCHEMA}.{TABLE_PRINCIPAL_REVISION}
+                WHERE principal_id = $1;
+            """
+    if await database.execute_query(query, principal_id, datetime.now()) is None:
+        raise RevocationError(f"Could not revoke the stateless tokens of principal {principal_id}")
+
+
+# Drop the cached principal of a user on every worker and, in stateless mode, revoke its stateless tokens,
+# for changes to role, group or license. Workers the notification does not reach see it within the cache TTL.
+# The eviction comes first so a failed revision write cannot leave the old principal authorizing.
+# It is published again after the bump, a revision read in between would otherwise stay cached.
+async def revoke_principal(user_id: int):
+    invalidation_bus.publish(TABLE_USER_SYSTEM_DESCRIPTION, user_id)
+    if STATELESS_AUTH:
+        await bump_revision(user_id)
+        invalidation_bus.publish(TABLE_USER_SYSTEM_DESCRIPTION, user_id)
+
+
+async def revoke_all_principals():
+    invalidation_bus.publish(TABLE_USER_SYSTEM_DESCRIPTION)
+    if STATELESS_AUTH:
+        await bump_revision(ALL_PRINCIPALS)
+        invalidation_bus.publish(TABLE_USER_SYSTEM_DESCRIPTION)
+
+
+# Invalidation handler, runs on every worker, user_id None means all principals
+def evict_principal(user_id: int = None):
+    if user_id is None:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate(user_id)
+        principal_cache.invalidate(("revisions", user_id))
+
+
+invalidation_bus.subscribe(TABLE_USER, evict_principal)
+invalidation_bus.subscribe(TABLE_USER_SYSTEM_DESCRIPTION, evict_principal)
+
+
+async def fetch_principal(userid: int):
+    query_result = principal_cache.get(userid)
+    if query_result is None:
+        query = f"""SELECT {SCHEMA}.{TABLE_USER}.*, {SCHEMA}.{TABLE_ROLE}.role_name, {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.*
+                    FROM {SCHEMA}.{TABLE_USER}
+                    JOIN {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}
+                        ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.user_id = {SCHEMA}.{TABLE_USER}.id
+                    JOIN {SCHEMA}.{TABLE_ROLE}
+                        ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.role_id = {SCHEMA}.{TABLE_ROLE}.id
+                    WHERE user_id = $1;
+                """
+        
+        query_result = await database.execute_query(query, userid)
+        if query_result:
+            principal_cache.set(userid, query_result)
+    return query_result
 
 
 async def get_current_user(security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)):
@@ -60,7 +186,7 @@ async def get_current_user(security_scopes: SecurityScopes, token: str = Depends
         headers={"WWW-Authenticate": authenticate_value},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         userid: str = payload.get("id")
         if username is None:
@@ -68,32 +194,24 @@ async def get_current_user(security_scopes: SecurityScopes, token: str = Depends
     except (JWTError, ValidationError):
         raise credentials_exception
 
-    query = f"""SELECT {SCHEMA}.{TABLE_USER}.*, {SCHEMA}.{TABLE_ROLE}.role_name, {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.*
-                FROM {SCHEMA}.{TABLE_USER}
-                JOIN {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}
-                    ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.user_id = {SCHEMA}.{TABLE_USER}.id
-                JOIN {SCHEMA}.{TABLE_ROLE}
-                    ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.role_id = {SCHEMA}.{TABLE_ROLE}.id
-                WHERE user_id = {userid};
-            """
-    
-    query_result = await database.execute_query(query=query)
+    if payload.get("mode") == "stateless":
+        if not STATELESS_AUTH or await is_revoked(payload):
+            raise credentials_exception
+        principal = payload["usr"]
+    else:
+        query_result = await fetch_principal(userid)
+        if not query_result:
+            raise credentials_exception
+        principal = query_result[0]
 
-    if not query_result:
-        raise credentials_exception
+    if not is_authorized(role_mask(principal['role_name']), scope_mask(tuple(security_scopes.scopes))):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not enough permissions",
+            headers={"WWW-Authenticate": authenticate_value},
+        )
 
-    token_scopes = [str(query_result[0]['role_name']).upper()]
-    token_scopes = assign_scopes(token_scopes)
-    token_data = TokenData(scopes=token_scopes, name=username)
-    for scope in security_scopes.scopes:
-        if scope not in token_data.scopes:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Not enough permissions",
-                headers={"WWW-Authenticate": authenticate_value},
-            )
-
-    return {**query_result[0], "disabled": False}
+    return {**principal, "disabled": False}
 
 
 async def get_current_active_user(current_user: UserSchema = Security(get_current_user)):
@@ -5,20 +5,120 @@ import numpy as np
 # ---------------------------------------------------------------------------------------------------
 
 
+# Same metrics as CalculationEngine.error_calculator, aggregated inside the database for one key ($1).
+# Aliases are lowercase, Redshift folds quoted identifiers to lowercase unless enable_case_sensitive_identifier is on
+ERROR_AGGREGATE_QUERY = """
+    SELECT COUNT(*) AS n,
+           AVG(ABS((actual - forecast) / actual)) * 100 AS mape,
+           AVG((forecast - actual) * (forecast - actual)) AS mse,
+           SQRT(AVG((forecast - actual) * (forecast - actual))) AS rmse,
+           AVG(ABS(forecast - actual)) AS mae,
+           SUM(ABS(actual - forecast)) / SUM(actual) AS wape
+    FROM (SELECT CAST(actual_value AS DOUBLE PRECISION) AS actual,
+                 CAST(forecast_value AS DOUBLE PRECISION) AS forecast
+          FROM {table}
+          WHERE {key_column} = $1) AS values_
+"""
+
+
+ERROR_METRICS = ("MAPE", "MSE", "RMSE", "MAE", "WAPE")
+
+
 class CalculationEngine:
     @staticmethod
     def error_calculator(ActualVals, ForecastedVals):
-        MAPE = np.mean(np.abs((np.array(ActualVals) - np.array(ForecastedVals)) / ActualVals)) * 100
-        MSE = np.square(np.subtract(ForecastedVals, ActualVals)).mean()
-        RMSE = np.sqrt(np.mean(np.square(ForecastedVals - ActualVals)))
-        MAE = np.mean(abs(ForecastedVals -ActualVals))
-        WAPE = (ActualVals - ForecastedVals).abs().sum() / ActualVals.sum()
-        return {"MAPE": MAPE, "MSE": MSE, "RMSE": RMSE, "MAE": MAE, "WAPE": WAPE}
+        # Accepts pandas Series or float64 numpy arrays
+        errors = CalculationEngine.error_kernel(ActualVals, ForecastedVals)
+        return {metric: errors[metric] for metric in ERROR_METRICS}
+
+
+    @staticmethod
+    def error_buffer(size: int):
+        # Workspace for error_kernel, reuse it across calls of at most `size` points
+        return np.empty((3, size), dtype=np.float64)
+
+
+    @staticmethod
+    def error_kernel(ActualVals, ForecastedVals, seasonality: int = 1, out=None):
+        # Fused kernel: the residual is computed once and every metric is derived from it in place,
+        # `out` is an optional error_buffer so repeated calls allocate nothing per point
+        actual = np.asarray(ActualVals, dtype=np.float64)
+        forecast = np.asarray(ForecastedVals, dtype=np.float64)
+        n = actual.size
+        if out is None:
+            out = CalculationEngine.error_buffer(n)
+        residual, scratch, scratch2 = out[0, :n], out[1, :n], out[2, :n]
+
+        np.subtract(actual, forecast, out=residual)
+        bias = -residual.sum() / n
+        mse = np.dot(residual, residual) / n
+        np.abs(residual, out=residual)
+        abs_sum = residual.sum()
+
+        # MAPE: |a - f| / |a|
+        np.abs(actual, out=scratch)
+        np.divide(residual, scratch, out=scratch2)
+        mape = scratch2.mean() * 100
+
+        # sMAPE: 2 |a - f| / (|a| + |f|)
+        np.abs(forecast, out=scratch2)
+        np.add(scratch, scratch2, out=scratch)
+        np.divide(residual, scratch, out=scratch)
+        smape = scratch.mean() * 200
+
+        # MASE: scaled by the in-sample seasonal naive forecast error
+        if n > seasonality:
+            naive = scratch[:n - seasonality]
+            np.subtract(actual[seasonality:], actual[:-seasonality], out=naive)
+            np.abs(naive, out=naive)
+            mase = (abs_sum / n) / naive.mean()
+        else:
+            mase = np.nan
+
+        return {"MAPE": mape, "MSE": mse, "RMSE": np.sqrt(mse), "MAE": abs_sum / n, "WAPE": abs_sum / actual.sum(),
+                "sMAPE": smape, "MASE": mase, "Bias": bias}
+
+
+    @staticmethod
+    def grouped_error_calculator(Keys, ActualVals, ForecastedVals):
+        # Segment-reduce of error_calculator, returns {key: metrics} for every distinct key
+        Keys = np.asarray(Keys)
+        ActualVals = np.asarray(ActualVals, dtype=np.float64)
+        ForecastedVals = np.asarray(ForecastedVals, dtype=np.float64)
+        groups, index = np.unique(Keys, return_inverse=True)
+        residual = ActualVals - ForecastedVals
+        abs_residual = np.abs(residual)
+
+        count = np.bincount(index, minlength=len(groups))
+        MAPE = np.bincount(index, weights=np.abs(residual / ActualVals), minlength=len(groups)) / count * 100
+        MSE = np.bincount(index, weights=np.square(residual), minlength=len(groups)) / count
+        RMSE = np.sqrt(MSE)
+        abs_sum = np.bincount(index, weights=abs_residual, minlength=len(groups))
+        MAE = abs_sum / count
+        WAPE = abs_sum / np.bincount(index, weights=ActualVals, minlength=len(groups))
+        return {key.item(): {"MAPE": MAPE[i], "MSE": MSE[i], "RMSE": RMSE[i], "MAE": MAE[i], "WAPE": WAPE[i]}
+                for i, key in enumerate(groups)}
+
+
+    @staticmethod
+    def error_query(table: str, key_column: str = "assign_model_id"):
+        return ERROR_AGGREGATE_QUERY.format(table=table, key_column=key_column)
+
+
+    @staticmethod
+    def error_from_aggregates(row: dict):
+        return {metric: float(row[metric.lower()]) for metric in ERROR_METRICS}
 
 
     @staticmethod
     def accuracy_calculator(actual_vals, forecasted_vals):
-        error = np.mean(np.abs((np.array(actual_vals) - np.array(forecasted_vals)) / actual_vals)) * 100
+        actual_vals = np.asarray(actual_vals, dtype=np.float64)
+        forecasted_vals = np.asarray(forecasted_vals, dtype=np.float64)
+        # One temporary, reused for the residual, the ratio and its abs
+        ratio = np.subtract(actual_vals, forecasted_vals)
+        np.divide(ratio, actual_vals, out=ratio)
+        np.abs(ratio, out=ratio)
+        error = ratio.mean() * 100
         accuracy = 100-error
         return {"Accuracy": accuracy, "Error": error}
 
@@ -28,3 +128,83 @@ class CalculationEngine:
         error = ((actual_vals - forecasted_vals) / actual_vals) * 100
         accuracy = 100 - error
         return {"Accuracy": accuracy, "Error": error}
+
+
+class ErrorAccumulator:
+    """
+    Mergeable running sums for the error_kernel metrics, so a series can be consumed chunk by chunk
+    (or split across workers) without holding it in memory. Chunks must be fed, and accumulators merged,
+    in series order for MASE; every other metric is order independent.
+    """
+
+    def __init__(self, seasonality: int = 1):
+        self.seasonality = seasonality
+        self.count = 0
+        self.sum_signed = 0.0
+        self.sum_sq = 0.0
+        self.sum_abs = 0.0
+        self.sum_actual = 0.0
+        self.sum_pct = 0.0
+        self.sum_spct = 0.0
+        self.naive_sum = 0.0
+        self.naive_count = 0
+        # First and last `seasonality` actuals, needed for the naive pairs across chunk boundaries
+        self.head = np.empty(0, dtype=np.float64)
+        self.tail = np.empty(0, dtype=np.float64)
+
+
+    def update(self, ActualVals, ForecastedVals):
+        other = ErrorAccumulator(self.seasonality)
+        actual = np.asarray(ActualVals, dtype=np.float64)
+        forecast = np.asarray(ForecastedVals, dtype=np.float64)
+        residual = actual - forecast
+        other.count = actual.size
+        other.sum_signed = residual.sum()
+        other.sum_sq = np.dot(residual, residual)
+        np.abs(residual, out=residual)
+        other.sum_abs = residual.sum()
+        other.sum_actual = actual.sum()
+        other.sum_pct = (residual / np.abs(actual)).sum()
+        other.sum_spct = (residual / (np.abs(actual) + np.abs(forecast))).sum()
+        if actual.size > self.seasonality:
+            other.naive_sum = np.abs(actual[self.seasonality:] - actual[:-self.seasonality]).sum()
+            other.naive_count = actual.size - self.seasonality
+        other.head = actual[:self.seasonality].copy()
+        other.tail = actual[-self.seasonality:].copy()
+        return self.merge(other)
+
+
+    def merge(self, other: "ErrorAccumulator"):
+        # `other` holds the points that follow the ones in self
+        if self.seasonality != other.seasonality:
+            raise ValueError("Cannot merge accumulators with different seasonality")
+
+        window = np.concatenate([self.tail, other.head])
+        if window.size > self.seasonality:
+            left = np.arange(window.size - self.seasonality)
+            crossing = (left < self.tail.size) & (left + self.seasonality >= self.tail.size)
+            pairs = np.abs(window[self.seasonality:] - window[:-self.seasonality])[crossing]
+            self.naive_sum += pairs.sum()
+            self.naive_count += pairs.size
+
+        self.count += other.count
+        self.sum_signed += other.sum_signed
+        self.sum_sq += other.sum_sq
+        self.sum_abs += other.sum_abs
+        self.sum_actual += other.sum_actual
+        self.sum_pct += other.sum_pct
+        self.sum_spct += other.sum_spct
+        self.naive_sum += other.naive_sum
+        self.naive_count += other.naive_count
+        self.head = np.concatenate([self.head, other.head])[:self.seasonality]
+        self.tail = np.concatenate([self.tail, other.tail])[-self.seasonality:]
+        return self
+
+
+    def result(self):
+        n = self.count
+        mse = self.sum_sq / n
+        mase = (self.sum_abs / n) / (self.naive_sum / self.naive_count) if self.naive_count else np.nan
+        return {"MAPE": self.sum_pct / n * 100, "MSE": mse, "RMSE": np.sqrt(mse), "MAE": self.sum_abs / n,
+                "WAPE": self.sum_abs / self.sum_actual, "sMAPE": self.sum_spct / n * 200, "MASE": mase,
+                "Bias": -self.sum_signed / n}
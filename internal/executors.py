@@ -0,0 +1,189 @@
+# Importing Python packages
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from environs import Env
+from functools import partial
+from passlib.hash import pbkdf2_sha256
+
+# Importing from project files
+from core.models.db import PoolBusyError
+
+
+logger = logging.getLogger('foo-logger')
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+env = Env()
+env.read_env()
+ANALYTICS_THREAD_WORKERS = env.int("ANALYTICS_THREAD_WORKERS", 4)
+PASSWORD_HASH_WORKERS = env.int("PASSWORD_HASH_WORKERS", 2)
+PASSWORD_HASH_QUEUE_LIMIT = env.int("PASSWORD_HASH_QUEUE_LIMIT", 64)
+# Bulk hashing has a pool of its own so onboarding many users hashes in parallel without taking the
+# login workers, one worker per CPU by default
+PASSWORD_HASH_BULK_WORKERS = env.int("PASSWORD_HASH_BULK_WORKERS", os.cpu_count() or 1)
+
+
+class HasherBusyError(Exception):
+    pass
+
+
+# Raised when the server is out of capacity, routes let them through to the 503 handler in main
+SERVER_BUSY_ERRORS = (HasherBusyError, PoolBusyError)
+
+
+class AnalyticsExecutor:
+    """
+    Keeps CPU bound analytics off the event loop on a thread pool: the NumPy error kernels, which
+    release the GIL, and decoding fetched records into arrays. The pool is created on app startup
+    and shut down with the app.
+    """
+
+    def __init__(self, thread_workers: int):
+        self.thread_workers = thread_workers
+        self._thread_pool = None
+
+
+    def start(self):
+        if self.thread_workers and not self._thread_pool:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers,
+                                                   thread_name_prefix="analytics")
+        logger.info("Analytics executors started")
+
+
+    def shutdown(self):
+        if self._thread_pool:
+            self._thread_pool.shutdown(wait=True, cancel_futures=True)
+            self._thread_pool = None
+        logger.info("Analytics executors shut down")
+
+
+    # Run func in the thread pool
+    async def run_thread(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._thread_pool, partial(func, *args, **kwargs))
+
+
+analytics_executor = AnalyticsExecutor(ANALYTICS_THREAD_WORKERS)
+
+
+def hash_passwords(passwords: list):
+    return [pbkdf2_sha256.hash(password) for password in passwords]
+
+
+class PasswordHasher:
+    """
+    Runs pbkdf2 hashing and verification on a dedicated thread pool so a login burst cannot
+    block the event loop. At most `queue_limit` passwords may be waiting or running,
+    beyond that callers get HasherBusyError instead of queueing without bound.
+    Bulk hashing runs in parallel on a second pool of `bulk_workers` threads, so the login pool
+    and its queue limit stay free for logins. pbkdf2 releases the GIL, the threads hash in parallel.
+    """
+
+    # Passwords hashed per bulk job
+    BULK_CHUNK_SIZE = 8
+
+    def __init__(self, workers: int, queue_limit: int, bulk_workers: int = 1):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.bulk_workers = max(1, bulk_workers)
+        self._bulk_slots = None
+        self.pending = 0
+        self.bulk_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_pending = 0
+        self.total_seconds = 0.0
+        self._pool = None
+        self._bulk_pool = None
+
+
+    def start(self):
+        if not self._pool:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        if not self._bulk_pool:
+            self._bulk_pool = ThreadPoolExecutor(max_workers=self.bulk_workers, thread_name_prefix="password-hash-bulk")
+
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._bulk_pool:
+            self._bulk_pool.shutdown(wait=True, cancel_futures=True)
+            self._bulk_pool = None
+
+
+    # `weight` is the number of passwords func handles, each of them counts against the queue limit.
+    # Bulk work runs on the bulk pool and is bounded by hash_many instead of the queue limit.
+    async def _run(self, func, *args, weight: int = 1, bulk: bool = False):
+        if not bulk and self.pending + weight > self.queue_limit:
+            self.rejected += 1
+            raise HasherBusyError("Password hashing queue is full")
+
+        self.start()
+        if bulk:
+            self.bulk_pending += weight
+        else:
+            self.pending += weight
+            self.max_pending = max(self.max_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._bulk_pool if bulk else self._pool,
+                                                                      func, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            if bulk:
+                self.bulk_pending -= weight
+            else:
+                self.pending -= weight
+        # Only finished operations count towards the average
+        self.completed += weight
+        self.total_seconds += time.perf_counter() - started
+        return result
+
+
+    async def hash(self, password: str):
+        return await self._run(pbkdf2_sha256.hash, password)
+
+
+    async def verify(self, password: str, password_hash: str):
+        return await self._run(pbkdf2_sha256.verify, password, password_hash)
+
+
+    # Hash a batch in small chunks on the bulk pool, one chunk per bulk worker at a time across all batches
+    async def hash_many(self, passwords: list):
+        if self._bulk_slots is None:
+            self._bulk_slots = asyncio.Semaphore(self.bulk_workers)
+
+        async def hash_chunk(chunk):
+            async with self._bulk_slots:
+                return await self._run(hash_passwords, chunk, weight=len(chunk), bulk=True)
+
+        chunk_size = self.BULK_CHUNK_SIZE
+        tasks = [asyncio.ensure_future(hash_chunk(passwords[start:start + chunk_size]))
+                 for start in range(0, len(passwords), chunk_size)]
+        try:
+            hashed = await asyncio.gather(*tasks)
+        finally:
+            # A failed chunk fails the batch, the chunks still waiting are not hashed
+            for task in tasks:
+                task.cancel()
+        return [password_hash for chunk in hashed for password_hash in chunk]
+
+
+    def stats(self):
+        return {"workers": self.workers, "bulk_workers": self.bulk_workers, "queue_limit": self.queue_limit,
+                "pending": self.pending, "bulk_pending": self.bulk_pending,
+                "max_pending": self.max_pending, "completed": self.completed, "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0}
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_BULK_WORKERS)
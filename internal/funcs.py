@@ -1,8 +1,10 @@
 # Importing Python packages
 import boto3
 from environs import Env
-from passlib.hash import pbkdf2_sha256
-from typing import Tuple
+from typing import Iterable, Tuple
+
+# Importing from project files
+from internal.executors import password_hasher
 
 
 # ---------------------------------------------------------------------------------------------------
@@ -24,13 +26,21 @@ s3_client = boto3.client(
 )
 
 
-def partial_update_query(record: Tuple):
-    key, value = record
-    if isinstance(value, int) or isinstance(value, float):
-        return f"{key}={value},"
-    elif isinstance(value, str):
-        if key == "password":
-            return f"{key}='{pbkdf2_sha256.hash(value)}',"
-        return f"{key}='{value}',"
-    else:
-        return str()
+async def partial_update_params(record: Iterable[Tuple], start: int = 1, exclude: Iterable[str] = ()):
+    """
+    Builds the SET clause of a partial update with $n placeholders.
+    Returns the clause and the list of values to bind, in placeholder order.
+    """
+    columns = []
+    values = []
+    for key, value in record:
+        if key in exclude:
+            continue
+        if isinstance(value, (int, float)):
+            values.append(value)
+        elif isinstance(value, str):
+            values.append(await password_hasher.hash(value) if key == "password" else value)
+        else:
+            continue
+        columns.append(f"{key}=${start + len(values) - 1}")
+    return ", ".join(columns), values
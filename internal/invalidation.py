@@ -0,0 +1,120 @@
+# Importing Python packages
+import asyncio
+import json
+import logging
+import uuid
+
+# Importing from project files
+from api_parameters import INVALIDATION_CHANNEL
+from core.models.database import database
+
+
+logger = logging.getLogger('foo-logger')
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+class InvalidationBus:
+    """
+    Tells every worker that rows of a table changed, so in-process caches can evict them.
+    Handlers subscribe per table and get the changed key, or None when the whole table changed.
+
+    publish() runs this worker's handlers right away and sends the message to the other workers
+    with NOTIFY on `channel`. Each worker LISTENs on a dedicated connection and queues received
+    messages in `inbox`. When the server cannot LISTEN, the bus only runs local handlers, and
+    messages put on `inbox` by hand (tests) are still dispatched like remote ones.
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        # Identifies this worker's own messages, NOTIFY also delivers them back to the sender
+        self.origin = uuid.uuid4().hex
+        self.remote = False
+        self.published = 0
+        self.received = 0
+        self.inbox = None
+        self._handlers = {}
+        self._consumer = None
+        self._pending_notifies = set()
+
+
+    def subscribe(self, table: str, handler):
+        self._handlers.setdefault(table, []).append(handler)
+
+
+    async def start(self):
+        if self._consumer:
+            return
+        self.inbox = asyncio.Queue()
+        self._consumer = asyncio.ensure_future(self._consume())
+        try:
+            await database.listen(self.channel, self._on_notify)
+            self.remote = True
+        except Exception as e:
+            # Redshift and test databases have no LISTEN, invalidations stay within this worker
+            logger.info(f"LISTEN unavailable, invalidations stay local: {e}")
+            self.remote = False
+
+
+    async def stop(self):
+        await database.stop_listening()
+        self.remote = False
+        if self._consumer:
+            self._consumer.cancel()
+            self._consumer = None
+
+
+    # Evict locally now and tell the other workers, key None means the whole table.
+    # local=False only tells the other workers, for callers that already evicted here.
+    def publish(self, table: str, key=None, local: bool = True):
+        self.published += 1
+        if local:
+            self._dispatch(table, key)
+        if self.remote:
+            payload = json.dumps({"origin": self.origin, "table": table, "key": key})
+            task = asyncio.ensure_future(database.notify(self.channel, payload))
+            self._pending_notifies.add(task)
+            task.add_done_callback(self._notified)
+
+
+    def _notified(self, task):
+        self._pending_notifies.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Invalidation not sent to the other workers: {task.exception()}")
+
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        if message.get("origin") != self.origin:
+            self.inbox.put_nowait((message["table"], message.get("key")))
+
+
+    async def _consume(self):
+        while True:
+            table, key = await self.inbox.get()
+            self.received += 1
+            self._dispatch(table, key)
+
+
+    def _dispatch(self, table: str, key=None):
+        for handler in self._handlers.get(table, ()):
+            try:
+                handler(key)
+            except Exception as e:
+                logger.exception(e)
+
+
+    def stats(self):
+        return {"remote": self.remote, "published": self.published, "received": self.received,
+                "subscribed_tables": sorted(self._handlers)}
+
+
+invalidation_bus = InvalidationBus(INVALIDATION_CHANNEL)
+
+# Topic of result cache invalidations, the key is the list of written tables
+QUERY_RESULTS = "query_results"
+
+# Writes through Database on this worker drop the cached reads of their tables on the other workers too
+database.write_listeners.append(lambda tables: invalidation_bus.publish(QUERY_RESULTS, sorted(tables), local=False))
+invalidation_bus.subscribe(QUERY_RESULTS, database.result_cache.invalidate_tables)
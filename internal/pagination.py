@@ -0,0 +1,108 @@
+# Importing Python packages
+import asyncio
+import base64
+import binascii
+import json
+
+# Importing FastAPI packages
+from fastapi import HTTPException, status
+
+# Importing from project files
+from api_parameters import SCHEMA, TOTAL_COUNT_CACHE_SIZE, TOTAL_COUNT_CACHE_TTL_SECONDS
+from core.models.database import database
+from core.models.db import PoolBusyError
+from internal.cache import TTLCache
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+# Table or counted relation -> exact row count, filled in the background for approximate totals
+total_counts = TTLCache(maxsize=TOTAL_COUNT_CACHE_SIZE, ttl=TOTAL_COUNT_CACHE_TTL_SECONDS)
+# Table -> running background count, also keeps the task referenced until it finishes
+_refreshing_totals = {}
+
+
+# Opaque cursor that carries the last key of the previous page
+def encode_cursor(last_key: int):
+    return base64.urlsafe_b64encode(json.dumps({"after": last_key}).encode()).decode()
+
+
+# Ids start at 1, so no cursor means every row is after key 0
+def decode_cursor(cursor: str = None):
+    if cursor is None:
+        return 0
+    try:
+        last_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+        if not isinstance(last_key, int):
+            raise ValueError("Cursor key must be an integer")
+        return last_key
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Invalid cursor")
+
+
+# Build a page from rows fetched with `WHERE key > $1 ORDER BY key LIMIT size + 1`,
+# the extra row only tells whether another page exists
+def keyset_page(rows: list, size: int, key: str = "id", total: int = None, total_is_exact: bool = None):
+    items = rows[:size]
+    next_cursor = encode_cursor(items[-1][key]) if len(rows) > size else None
+    return {"items": items, "size": size, "next_cursor": next_cursor, "total": total, "total_is_exact": total_is_exact}
+
+
+# `relation` is the FROM clause to count when a page reads more than the table, e.g. a join
+async def exact_total(table: str, relation: str = None):
+    query = f"SELECT COUNT(*) AS total FROM {relation or f'{SCHEMA}.{table}'};"
+    result = await database.execute_query(query)
+    if not result:
+        return None
+    total_counts.set(relation or table, result[0]["total"])
+    return result[0]["total"]
+
+
+# Row estimate kept by ANALYZE, pg_class is available on both Postgres and Redshift
+async def estimated_total(table: str):
+    query = """
+                SELECT CAST(pg_class.reltuples AS BIGINT) AS total
+                FROM pg_class
+                JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+                WHERE pg_namespace.nspname = $1 AND pg_class.relname = $2;
+            """
+    result = await database.execute_query(query, SCHEMA, table)
+    return result[0]["total"] if result else None
+
+
+# Count the table in the background, at most one count per table at a time
+def refresh_total(table: str, relation: str = None):
+    key = relation or table
+    if key in _refreshing_totals:
+        return
+    task = asyncio.ensure_future(_refresh_total(table, relation))
+    _refreshing_totals[key] = task
+    task.add_done_callback(lambda _: _refreshing_totals.pop(key, None))
+
+
+async def _refresh_total(table: str, relation: str = None):
+    try:
+        await exact_total(table, relation)
+    except PoolBusyError:
+        # Counted again by the next request that finds no cached total
+        pass
+
+
+# Total rows of a table, or of `relation` estimated from the table statistics, for a page response,
+# returns (total, total_is_exact)
+# - none: no total
+# - exact: COUNT(*) on every request
+# - approximate: last background count, or the table statistics while that count runs
+async def page_total(table: str, mode: str, relation: str = None):
+    if mode == "exact":
+        total = await exact_total(table, relation)
+        return total, True if total is not None else None
+    if mode == "approximate":
+        total = total_counts.get(relation or table)
+        if total is None:
+            refresh_total(table, relation)
+            total = await estimated_total(table)
+        return total, False if total is not None else None
+    return None, None
@@ -0,0 +1,127 @@
+# Importing Python packages
+import asyncio
+import time
+from bisect import bisect_right
+
+# Importing from project files
+from api_parameters import REFERENCE_DATA_TTL_SECONDS, SCHEMA, TABLE_COMMODITY_GROUP, TABLE_GROUP, TABLE_LICENSE, \
+    TABLE_ROLE
+from core.models.database import database
+from internal.invalidation import invalidation_bus
+from internal.pagination import page_total
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+class ReferenceTable:
+    """
+    Small, rarely changing table held in memory with id and name indexes.
+    Reads are served from the last loaded snapshot. A load builds a new snapshot and swaps it in
+    one assignment, so readers never see a half built index. Loaded on startup, reloaded after
+    writes on any worker (through the invalidation bus) and whenever the snapshot is older than `ttl` seconds.
+    Rows are handed out as copies, callers cannot change the shared snapshot.
+    """
+
+    def __init__(self, table: str, name_column: str = None, ttl: float = REFERENCE_DATA_TTL_SECONDS):
+        self.table = table
+        self.name_column = name_column
+        self.ttl = ttl
+        self.loads = 0
+        # (rows ordered by id, ids, id -> row, name -> row)
+        self._snapshot = ([], [], {}, {})
+        self._expires_at = 0.0
+        # Bumped by invalidate(), a snapshot loaded before the last bump is stale
+        self._version = 0
+        self._loaded_version = 0
+        self._lock = None
+
+
+    # Read the whole table and swap the snapshot, the previous one is kept if the query fails
+    async def load(self):
+        query = f"SELECT * FROM {SCHEMA}.{self.table} ORDER BY id;"
+        version = self._version
+        rows = await database.execute_query(query)
+        if rows is None:
+            return False
+
+        ids = [row["id"] for row in rows]
+        by_id = dict(zip(ids, rows))
+        by_name = {row[self.name_column]: row for row in rows} if self.name_column else {}
+        self._snapshot = (rows, ids, by_id, by_name)
+        self._expires_at = time.monotonic() + self.ttl
+        self._loaded_version = version
+        self.loads += 1
+        return True
+
+
+    # Mark the snapshot stale, the next read reloads it, key is ignored since the whole table is reloaded
+    def invalidate(self, key=None):
+        self._version += 1
+
+
+    # Reload after a write here and make every other worker reload on its next read
+    async def refresh(self):
+        invalidation_bus.publish(self.table)
+        await self._fresh()
+
+
+    def _stale(self):
+        return self._loaded_version != self._version or time.monotonic() >= self._expires_at
+
+
+    async def _fresh(self):
+        if self._stale():
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._stale():
+                    await self.load()
+        return self._snapshot
+
+
+    async def get(self, key: int):
+        _, _, by_id, _ = await self._fresh()
+        row = by_id.get(key)
+        return dict(row) if row is not None else None
+
+
+    async def get_by_name(self, name: str):
+        _, _, _, by_name = await self._fresh()
+        row = by_name.get(name)
+        return dict(row) if row is not None else None
+
+
+    # Rows with id > after_key, at most `limit` of them
+    async def page(self, after_key: int, limit: int):
+        rows, ids, _, _ = await self._fresh()
+        start = bisect_right(ids, after_key)
+        return [dict(row) for row in rows[start:start + limit]]
+
+
+    async def count(self):
+        rows, _, _, _ = await self._fresh()
+        return len(rows)
+
+
+    # (total, total_is_exact) for a page, the snapshot may lag behind the table so only `exact` counts in SQL
+    async def page_total(self, mode: str):
+        if mode == "exact":
+            return await page_total(self.table, mode)
+        if mode == "approximate":
+            return await self.count(), False
+        return None, None
+
+
+roles = ReferenceTable(TABLE_ROLE, "role_name")
+groups = ReferenceTable(TABLE_GROUP, "group_name")
+commodity_groups = ReferenceTable(TABLE_COMMODITY_GROUP, "comm_group_name")
+licenses = ReferenceTable(TABLE_LICENSE)
+reference_tables = (roles, groups, commodity_groups, licenses)
+
+for reference_table in reference_tables:
+    invalidation_bus.subscribe(reference_table.table, reference_table.invalidate)
+
+
+async def load_reference_data():
+    await asyncio.gather(*(table.load() for table in reference_tables))
@@ -0,0 +1,28 @@
+# Importing Python packages
+from functools import wraps
+
+# Importing from project files
+from core.models.database import database
+from core.models.db import SingleFlight
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+route_calls = SingleFlight()
+
+
+# Route decorator, concurrent requests with the same parameters share one run of the handler.
+# Parameters in `exclude` are left out of the key, by default the user, so only use it on
+# read-only handlers whose result does not depend on who asks. A request that comes after a write
+# to one of `tables` does not join a run that started before it.
+def single_flight(tables=(), exclude=("current_user",)):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (func.__module__, func.__qualname__, args,
+                   tuple(sorted((name, value) for name, value in kwargs.items() if name not in exclude)),
+                   database.result_cache.generation(tables))
+            return await route_calls.run(key, func, *args, **kwargs)
+        return wrapper
+    return decorator
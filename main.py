@@ -3,15 +3,20 @@ from environs import Env
 import logging
 
 # Importing FastAPI packages
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
-from fastapi_pagination import add_pagination
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.staticfiles import StaticFiles
 
 # Importing from project files
 from core.models.database import database
+from core.models.db import PoolBusyError
+from internal.executors import analytics_executor, password_hasher, HasherBusyError
+from internal.invalidation import invalidation_bus
+from internal.reference import load_reference_data
+from internal.Token import RevocationError
 from routers import route
 
 
@@ -39,6 +44,17 @@ cors_origin_all = env("CORS_ORIGIN_ALL")
 allow_methods = env("CORS_ALLOW_METHODS")
 allow_headers = env("CORS_ALLOW_HEADERS")
 
+
+# Turn requests away while the database pool has too many waiters. Requests that get in and then
+# cannot get a connection raise PoolBusyError, which server_busy_handler answers.
+# Added before CORS so that CORS wraps it and busy responses keep their CORS headers.
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if database.pool_saturated():
+        return await server_busy_handler(request, None)
+    return await call_next(request)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[cors_origin_all],
@@ -52,6 +68,11 @@ app.add_middleware(
 async def startup():
     await database.connect()
     app.state.db = database
+    await invalidation_bus.start()
+    await load_reference_data()
+    analytics_executor.start()
+    app.state.executor = analytics_executor
+    password_hasher.start()
     logger.info("Server Startup")
 
 
@@ -59,9 +80,26 @@ async def startup():
 async def shutdown():
     if not app.state.db:
         await app.state.db.close()
+    await invalidation_bus.stop()
+    analytics_executor.shutdown()
+    password_hasher.shutdown()
     logger.info("Server Shutdown")
 
 
+@app.exception_handler(HasherBusyError)
+@app.exception_handler(PoolBusyError)
+async def server_busy_handler(request: Request, exc: Exception):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "Server is busy, please try again"},
+                        headers={"Retry-After": "1"})
+
+
+@app.exception_handler(RevocationError)
+async def revocation_error_handler(request: Request, exc: RevocationError):
+    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        content={"detail": "Saved, but signed in users keep their old access until their tokens expire"})
+
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(
@@ -76,6 +114,3 @@ async def custom_swagger_ui_html():
 
 app.include_router(route.router)
 
-
-# Adding Pagination
-add_pagination(app)
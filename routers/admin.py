@@ -0,0 +1,124 @@
+# Importing FastAPI packages
+from fastapi import APIRouter, Query, status, Security
+
+# Importing from project files
+from core.models.database import database
+from core.scopes.set_scope import Role
+from core.schemas.schemas import UserSchema
+from internal.executors import password_hasher
+from internal.invalidation import invalidation_bus
+from internal.singleflight import route_calls
+from internal.Token import get_current_active_user, principal_cache, verified_tokens
+
+
+# Router Object to Create Routes
+router = APIRouter(
+    prefix='/admin',
+    tags=["Admin"]
+)
+
+
+# ---------------------------------------------------------------------------------------------------
+
+
+# Gets hit rate and memory use of the in-process caches
+@router.get('/cache/', status_code=status.HTTP_200_OK,
+            summary="Get cache statistics",
+            response_description="Cache statistics fetched successfully")
+async def get_cache_stats(current_user: UserSchema = Security(get_current_active_user,
+                                                              scopes=[Role.ADMIN['name']])) -> dict:
+    """
+        Get statistics of the in-process caches of this worker:
+
+        - **query_results**: Query result cache, `bytes` is the estimated memory held by cached rows.
+        - **principals**: Users resolved from access tokens.
+        - **verified_tokens**: Access tokens whose signature was already verified.
+        - **query_flights**, **route_flights**: Reads and route calls that concurrent callers shared
+          instead of running again.
+        - **invalidations**: Cache invalidations published by this worker and received from the others.
+
+    """
+    print("Calling get_cache_stats method")
+
+    return {"query_results": database.result_cache.stats(),
+            "principals": principal_cache.stats(),
+            "verified_tokens": verified_tokens.stats(),
+            "query_flights": database.flight_stats(),
+            "route_flights": route_calls.stats(),
+            "invalidations": invalidation_bus.stats()}
+
+
+# Gets the load of the password hashing pools
+@router.get('/executors/', status_code=status.HTTP_200_OK,
+            summary="Get executor statistics",
+            response_description="Executor statistics fetched successfully")
+async def get_executor_stats(current_user: UserSchema = Security(get_current_active_user,
+                                                                 scopes=[Role.ADMIN['name']])) -> dict:
+    """
+        Get the password hashing load of this worker:
+
+        - **workers**, **bulk_workers**: Threads hashing for logins and for bulk user creation. (INT)
+        - **queue_limit**, **pending**, **max_pending**: Passwords allowed, waiting or running now, and at most
+          so far on the login pool, beyond the limit requests get 503. (INT)
+        - **bulk_pending**: Passwords of bulk creations waiting or running now. (INT)
+        - **completed**, **failed**, **rejected**: Passwords hashed or verified, operations that raised, and
+          operations refused because the queue was full. (INT)
+        - **avg_seconds**: Time per completed password, including the wait for a worker. (FLOAT)
+
+    """
+    print("Calling get_executor_stats method")
+
+    return {"password_hasher": password_hasher.stats()}
+
+
+# Gets connection pool usage
+@router.get('/pool/', status_code=status.HTTP_200_OK,
+            summary="Get connection pool statistics",
+            response_description="Pool statistics fetched successfully")
+async def get_pool_stats(current_user: UserSchema = Security(get_current_active_user,
+                                                             scopes=[Role.ADMIN['name']])) -> dict:
+    """
+        Get the database connection pool usage of this worker:
+
+        - **size**, **max_size**, **in_use**, **idle**: Connections open, allowed, handed out and free. (INT)
+        - **waiters**, **max_waiters**: Callers waiting for a connection now, and the limit beyond
+          which requests get 503. (INT)
+        - **rejected**, **timeouts**: Acquires refused because of the waiter limit, or because no
+          connection freed up within **acquire_timeout** seconds. (INT)
+        - **acquire_p50_seconds**, **acquire_p95_seconds**, **acquire_p99_seconds**: Wait for a connection
+          over the last 1024 acquires. (FLOAT)
+
+    """
+    print("Calling get_pool_stats method")
+
+    return database.pool_stats()
+
+
+# Gets the statements that took the most time
+@router.get('/queries/', status_code=status.HTTP_200_OK,
+            summary="Get the top statements by time spent",
+            response_description="Statement statistics fetched successfully")
+async def get_query_stats(limit: int = Query(20, ge=1, le=200),
+                          sort_by: str = Query("total_seconds",
+                                               regex="^(total_seconds|calls|rows|errors|max_seconds|acquire_seconds|"
+                                                     "execute_seconds|decode_seconds)$"),
+                          current_user: UserSchema = Security(get_current_active_user,
+                                                              scopes=[Role.ADMIN['name']])) -> dict:
+    """
+        Get the statements of this worker with the largest `sort_by`, aggregated by fingerprint
+        (statement text with literals replaced by `?`):
+
+        - **calls**, **rows**, **errors**: Totals since the worker started. (INT)
+        - **acquire_seconds**, **execute_seconds**, **decode_seconds**: Time waiting for a pool connection,
+          running the statement and converting rows. (FLOAT)
+        - **total_seconds**, **mean_seconds**, **max_seconds**: Total latency. (FLOAT)
+        - **p50_seconds**, **p95_seconds**, **p99_seconds**: Upper bound of the histogram bucket
+          holding the percentile. (FLOAT)
+        - **histogram**: Number of calls per latency bucket, keyed by the bucket upper bound in seconds. (DICT)
+
+    """
+    print("Calling get_query_stats method")
+
+    return {"slow_query_seconds": database.query_stats.slow_query_seconds,
+            "slow_queries": database.query_stats.slow_queries,
+            "statements": database.query_stats.top(limit, sort_by)}
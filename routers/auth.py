@@ -1,6 +1,5 @@
 # Importing Python packages
 import traceback
-from passlib.hash import pbkdf2_sha256
 
 # Importing FastAPI packages
 from fastapi import APIRouter, status, HTTPException, Depends
@@ -8,7 +7,8 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 # Importing from project files
 from core.models.database import database
-from internal.Token import create_access_token
+from internal.executors import password_hasher, SERVER_BUSY_ERRORS
+from internal.Token import create_access_token, fetch_principal, stateless_claims, STATELESS_AUTH
 from api_parameters import SCHEMA, TABLE_USER
 
 
@@ -33,22 +33,37 @@ async def log_in(request: OAuth2PasswordRequestForm = Depends()):
     print("Calling log_in method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER} WHERE username = '{request.username.lower()}';"
-        user_result = await database.execute_query(query=query)
+        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER} WHERE username = $1;"
+        user_result = await database.execute_query(query, request.username.lower())
 
         if not user_result:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail="User not found")
         
-        if not pbkdf2_sha256.verify(request.password, user_result[0]["password"]):
+        if not await password_hasher.verify(request.password, user_result[0]["password"]):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail="Password is incorrect")
         
-        access_token = create_access_token(data={"sub": user_result[0]["username"],
-                                                 "scopes": request.scopes,
-                                                 "id": user_result[0]["id"]},
-                                           token_type="access")
+        if STATELESS_AUTH:
+            principal = await fetch_principal(user_result[0]["id"])
+            if not principal:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail="User not found")
+
+            access_token = create_access_token(data={"sub": user_result[0]["username"],
+                                                     "scopes": request.scopes,
+                                                     "id": user_result[0]["id"],
+                                                     **await stateless_claims(principal[0])},
+                                               token_type="stateless")
+        else:
+            access_token = create_access_token(data={"sub": user_result[0]["username"],
+                                                     "scopes": request.scopes,
+                                                     "id": user_result[0]["id"]},
+                                               token_type="access")
         
+    except SERVER_BUSY_ERRORS:
+        raise
+
     except Exception as e:
         exception_list = traceback.format_exc()
         exception_list += "\n\n"
@@ -1,16 +1,19 @@
 # Importing Python packages
 import traceback
+from typing import Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_COMMODITY
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_COMMODITY
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema, CommodityInSchema, CommoditySchema, CommodityPatchInSchema, CommodityPatchSchema
-from internal.funcs import partial_update_query
+from core.schemas.schemas import KeysetPage, UserSchema, CommodityInSchema, CommoditySchema, CommodityPatchInSchema, CommodityPatchSchema
+from internal.executors import SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.pagination import decode_cursor, keyset_page, page_total
+from internal.singleflight import single_flight
 from internal.Token import get_current_active_user
 
 
@@ -44,17 +47,20 @@ async def create_commodity(record: CommodityInSchema,
 
     try:
         # Check if commodity already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_COMMODITY} WHERE commodity_name = '{record.commodity_name}';"
-        commodity_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_COMMODITY} WHERE commodity_name = $1;"
+        commodity_result = await database.execute_query(query, record.commodity_name)
 
         if commodity_result:
             raise Exception("Commodity already exists")
 
         query = f"""
-                    INSERT INTO {SCHEMA}.{TABLE_COMMODITY} (commodity_name, active, group_id)
-                    VALUES ('{record.commodity_name}', {record.active}, {record.group_id})
+                    INSERT INTO {SCHEMA}.{TABLE_COMMODITY} (commodity_name, active, comm_group_id)
+                    VALUES ($1, $2, $3)
                 """
-        last_record_id = await database.execute_query(query=query)
+        last_record_id = await database.execute_query(query, record.commodity_name, record.active, record.comm_group_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -95,8 +101,11 @@ async def get_commodity(commodity_id: int,
     print("Calling get_commodity method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id = '{commodity_id}'"
-        result = await database.execute_query(query=query)
+        query = f"SELECT * FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id = $1"
+        result = await database.execute_query(query, commodity_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -114,9 +123,13 @@ async def get_commodity(commodity_id: int,
 # Get all commodities from yt_commodity table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all commodities",
-            response_model=Page[CommoditySchema],
+            response_model=KeysetPage[CommoditySchema],
             response_description="Commodities fetched successfully")
-async def get_all_commodities(current_user: UserSchema = Security(get_current_active_user,
+@single_flight(tables=(TABLE_COMMODITY,))
+async def get_all_commodities(cursor: Union[str, None] = None,
+                              size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                              total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                              current_user: UserSchema = Security(get_current_active_user,
                                                                   scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all commodities with following information:
@@ -128,12 +141,22 @@ async def get_all_commodities(current_user: UserSchema = Security(get_current_ac
         - **created_at**: Datetime of the commodity creation. (DATETIME)
         - **updated_at**: Datetime of the commodity updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from cached counts or table statistics),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_commodities method")
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_COMMODITY}"
-        result = await database.execute_query(query=query)
+        query = f"SELECT * FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id > $1 ORDER BY id LIMIT $2;"
+        result = await database.execute_query(query, after_key, size + 1)
+        total, total_is_exact = await page_total(TABLE_COMMODITY, total_mode)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -141,7 +164,11 @@ async def get_all_commodities(current_user: UserSchema = Security(get_current_ac
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, total=total, total_is_exact=total_is_exact)
 
 
 # Updates single commodity in yt_commodity table based on id
@@ -165,10 +192,14 @@ async def update_commodity(commodity_id: int, record: CommodityInSchema,
     try:
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_COMMODITY}
-                    SET commodity_name = '{record.commodity_name}', active = {record.active}, group_id = {record.group_id}
-                    WHERE id = '{commodity_id}'
+                    SET commodity_name = $1, active = $2, comm_group_id = $3
+                    WHERE id = $4
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.commodity_name, record.active, record.comm_group_id,
+                                              commodity_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -202,15 +233,17 @@ async def partial_update_commodity(commodity_id: int, record: CommodityPatchInSc
     print("Calling partial_update_commodity method")
 
     try:
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record)
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_COMMODITY}
                     SET {query_string}
-                    WHERE id = {commodity_id}
+                    WHERE id = ${len(args) + 1}
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, commodity_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -240,11 +273,14 @@ async def delete_commodity(commodity_id: int,
 
     try:
         # Check if record already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id = {commodity_id};"
-        check_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id = $1;"
+        check_result = await database.execute_query(query, commodity_id)
+
+        query = f"DELETE FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id = $1"
+        result = await database.execute_query(query, commodity_id)
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_COMMODITY} WHERE id = {commodity_id}"
-        result = await database.execute_query(query=query)
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -1,17 +1,20 @@
 # Importing Python packages
 import traceback
+from typing import Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_COMMODITY_GROUP
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_COMMODITY_GROUP
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema, CommodityGroupInSchema, CommodityGroupSchema, CommodityGroupPatchInSchema, \
+from core.schemas.schemas import KeysetPage, UserSchema, CommodityGroupInSchema, CommodityGroupSchema, CommodityGroupPatchInSchema, \
     CommodityGroupPatchSchema
-from internal.funcs import partial_update_query
+from internal.executors import SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.pagination import decode_cursor, keyset_page
+from internal.reference import commodity_groups
 from internal.Token import get_current_active_user
 
 
@@ -44,9 +47,13 @@ async def create_commodity_group(record: CommodityGroupInSchema,
     try:
         query = f"""
                     INSERT INTO {SCHEMA}.{TABLE_COMMODITY_GROUP} (comm_group_name)
-                    VALUES ('{record.comm_group_name}')
+                    VALUES ($1)
                 """
-        last_record_id = await database.execute_query(query=query)
+        last_record_id = await database.execute_query(query, record.comm_group_name)
+        await commodity_groups.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -81,8 +88,10 @@ async def get_commodity_group(commodity_group_id: int,
     print("Calling get_commodity_group method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_COMMODITY_GROUP} WHERE id = {commodity_group_id}"
-        result = await database.execute_query(query=query)
+        result = await commodity_groups.get(commodity_group_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -94,15 +103,18 @@ async def get_commodity_group(commodity_group_id: int,
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Id does not exist")
 
-    return result[0]
+    return result
 
 
 # Get all commodity groups from yt_comm_group table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all commodity groups",
-            response_model=Page[CommodityGroupSchema],
+            response_model=KeysetPage[CommodityGroupSchema],
             response_description="Commodity Groups fetched successfully")
-async def get_all_commodity_groups(current_user: UserSchema = Security(get_current_active_user,
+async def get_all_commodity_groups(cursor: Union[str, None] = None,
+                                   size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                   total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                                   current_user: UserSchema = Security(get_current_active_user,
                                                                        scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all commodity groups with following information:
@@ -112,12 +124,21 @@ async def get_all_commodity_groups(current_user: UserSchema = Security(get_curre
         - **created_at**: Datetime of the commodity group creation. (DATETIME)
         - **updated_at**: Datetime of the commodity group updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from the cached table),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_commodity_groups method")
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_COMMODITY_GROUP}"
-        result = await database.execute_query(query=query)
+        result = await commodity_groups.page(after_key, size + 1)
+        total, total_is_exact = await commodity_groups.page_total(total_mode)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -125,7 +146,11 @@ async def get_all_commodity_groups(current_user: UserSchema = Security(get_curre
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, total=total, total_is_exact=total_is_exact)
 
 
 # Updates single commodity group in yt_comm_group table
@@ -147,10 +172,14 @@ async def update_commodity_group(commodity_group_id: int, record: CommodityGroup
     try:
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_COMMODITY_GROUP}
-                    SET comm_group_name = '{record.comm_group_name}'
-                    WHERE id = {commodity_group_id}
+                    SET comm_group_name = $1
+                    WHERE id = $2
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.comm_group_name, commodity_group_id)
+        await commodity_groups.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -182,15 +211,18 @@ async def partial_update_commodity_group(commodity_group_id: int, record: Commod
     print("Calling partial_update_commodity_group method")
 
     try:
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record)
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_COMMODITY_GROUP}
                     SET {query_string}
-                    WHERE id = {commodity_group_id}
+                    WHERE id = ${len(args) + 1}
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, commodity_group_id)
+        await commodity_groups.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -220,11 +252,15 @@ async def delete_commodity_group(commodity_group_id: int,
 
     try:
         # Check if record already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_COMMODITY_GROUP} WHERE id = {commodity_group_id};"
-        check_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_COMMODITY_GROUP} WHERE id = $1;"
+        check_result = await database.execute_query(query, commodity_group_id)
+
+        query = f"DELETE FROM {SCHEMA}.{TABLE_COMMODITY_GROUP} WHERE id = $1"
+        result = await database.execute_query(query, commodity_group_id)
+        await commodity_groups.refresh()
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_COMMODITY_GROUP} WHERE id = {commodity_group_id}"
-        result = await database.execute_query(query=query)
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -1,19 +1,18 @@
 # Importing Python packages
 import traceback
-import pandas as pd
-import json
 from datetime import date
 
 # Importing FastAPI packages
-from fastapi import APIRouter, status, HTTPException, Security
+from fastapi import APIRouter, status, HTTPException, Query, Security
 
 # Importing from project files
 from api_parameters import SCHEMA, TABLE_MODEL_FORECAST,TABLE_MODEL,TABLE_ASSIGN_MODEL,TABLE_MODEL_METRIC_TYPE,TABLE_MODEL_METRIC
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema
+from core.schemas.schemas import UserSchema, ErrorBatchInSchema
 from internal.Token import get_current_active_user
-from internal.calculationengine import CalculationEngine
+from internal.calculationengine import CalculationEngine, ErrorAccumulator, ERROR_METRICS
+from internal.executors import analytics_executor, SERVER_BUSY_ERRORS
 
 
 router = APIRouter(
@@ -28,6 +27,7 @@ router = APIRouter(
 @router.get('/get/errors/{assign_model_id}',
             summary="Gets all types of errors by providing model id")
 async def calculate_errors(assign_model_id: int,
+                           engine: str = Query("numpy", regex="^(numpy|sql|stream)$"),
                            current_user: UserSchema = Security(get_current_active_user,
                                                                scopes=[Role.REPORTING_USER['name']])):
     """
@@ -35,47 +35,82 @@ async def calculate_errors(assign_model_id: int,
 
         `MAPE`, `MSE`,`RMSE`, `MAE`, `WAPE`, `model`
 
+        - **engine**: `numpy` computes the errors in the API, `sql` computes them inside the database
+          and only transfers the five values, `stream` computes them in the API chunk by chunk over a cursor
+          for series that do not fit in memory. (STR) *--Optional* (Default: numpy)
+
     """
 
     try:
-        query = f"""
-                    SELECT forecast_value, actual_value
-                    FROM {SCHEMA}.{TABLE_MODEL_FORECAST}
-                    WHERE assign_model_id = {assign_model_id};
-                """
-        records = await database.execute_query(query)
+        if engine == "sql":
+            query = CalculationEngine.error_query(f"{SCHEMA}.{TABLE_MODEL_FORECAST}")
+            aggregates = await database.execute_query(query, assign_model_id)
 
-        if len(records) == 0:
-            return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="No records found for this assigned model range")
+            if not aggregates or aggregates[0]["n"] == 0:
+                return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                     detail="No records found for this assigned model range")
+
+            errors_lstm = CalculationEngine.error_from_aggregates(aggregates[0])
+
+        elif engine == "stream":
+            query = f"""
+                        SELECT forecast_value, actual_value
+                        FROM {SCHEMA}.{TABLE_MODEL_FORECAST}
+                        WHERE assign_model_id = $1;
+                    """
+            accumulator = ErrorAccumulator()
+            async with database.stream_query(query, assign_model_id) as batches:
+                async for batch in batches:
+                    await analytics_executor.run_thread(accumulator.update,
+                                                        ActualVals=[row["actual_value"] for row in batch],
+                                                        ForecastedVals=[row["forecast_value"] for row in batch])
+
+            if accumulator.count == 0:
+                return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                     detail="No records found for this assigned model range")
+
+            errors = accumulator.result()
+            errors_lstm = {metric: errors[metric] for metric in ERROR_METRICS}
+
+        else:
+            query = f"""
+                        SELECT forecast_value, actual_value
+                        FROM {SCHEMA}.{TABLE_MODEL_FORECAST}
+                        WHERE assign_model_id = $1;
+                    """
+            columns = await database.fetch_columns(query, assign_model_id, decode=analytics_executor.run_thread)
 
-        # Convert list of dictionaries to json
-        result = json.dumps(records, indent=1).replace("</", "<\\/")
-        result = pd.read_json(result)
+            if len(columns["actual_value"]) == 0:
+                return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="No records found for this assigned model range")
 
-        errors_lstm = CalculationEngine.error_calculator(ActualVals=result["actual_value"],
-                                                         ForecastedVals=result["forecast_value"])
+            errors_lstm = await analytics_executor.run_thread(CalculationEngine.error_calculator,
+                                                              ActualVals=columns["actual_value"],
+                                                              ForecastedVals=columns["forecast_value"])
 
         query2= f"SELECT id, type_name FROM {SCHEMA}.{TABLE_MODEL_METRIC_TYPE};"
 
-        metric_types = await database.execute_query(query2)
-
-        for type in metric_types:
-            query3 = f"""
-                        INSERT INTO {SCHEMA}.{TABLE_MODEL_METRIC} (metric_score, metric_type_id, assign_model_id)
-                        VALUES ({errors_lstm[type['type_name']]}, {type['id']}, {assign_model_id});
-                    """
-            insert_model_metrice = await database.execute_query(query=query3)
-    
         query4=f"""SELECT model_name 
                     FROM {SCHEMA}.{TABLE_MODEL}
                     WHERE id IN (SELECT model_id
                                  FROM {SCHEMA}.{TABLE_ASSIGN_MODEL}
-                                 WHERE id = {assign_model_id});"""
-        model_name = await database.execute_query(query4)
-        
+                                 WHERE id = $1);"""
+        metric_types, model_name = await database.execute_concurrently((query2,), (query4, assign_model_id), cache=True)
+
+        metric_records = [(float(errors_lstm[type['type_name']]), type['id'], assign_model_id)
+                          for type in metric_types]
+        insert_model_metrice = await database.insert_many(TABLE_MODEL_METRIC,
+                                                          ["metric_score", "metric_type_id", "assign_model_id"],
+                                                          metric_records, schema=SCHEMA)
+        if insert_model_metrice == None:
+            return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                 detail="Could not store the error metrics")
+
         return [{**errors_lstm, "model": model_name[0]["model_name"]}]
 
+    except SERVER_BUSY_ERRORS:
+        raise
+
     except Exception as e:
         exception_list = traceback.format_exc()
         exception_list += "\n\n"
@@ -84,3 +119,75 @@ async def calculate_errors(assign_model_id: int,
         
         return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                              detail="Something went wrong")
+
+
+@router.post('/errors/batch/',
+             summary="Gets all types of errors for many assigned models at once")
+async def calculate_errors_batch(record: ErrorBatchInSchema,
+                                 current_user: UserSchema = Security(get_current_active_user,
+                                                                     scopes=[Role.REPORTING_USER['name']])):
+    """
+        Computes and stores the errors of every assigned model in one pass:
+
+        - **assign_model_ids**: Ids of the assigned models. (LIST[INT]) *--Required*
+
+        Returns `results` with `MAPE`, `MSE`,`RMSE`, `MAE`, `WAPE`, `model`, `assign_model_id` per assigned model
+        and `missing` with the ids that have no forecast records.
+
+    """
+
+    try:
+        assign_model_ids = sorted(set(record.assign_model_ids))
+
+        columns = await database.fetch_columns_in_list(lambda in_list: f"""
+                    SELECT assign_model_id, forecast_value, actual_value
+                    FROM {SCHEMA}.{TABLE_MODEL_FORECAST}
+                    WHERE assign_model_id IN ({in_list});
+                """, assign_model_ids, decode=analytics_executor.run_thread)
+
+        if columns is None:
+            return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                 detail="Could not read the forecast records")
+
+        errors = await analytics_executor.run_thread(CalculationEngine.grouped_error_calculator,
+                                                     Keys=columns["assign_model_id"].astype("int64"),
+                                                     ActualVals=columns["actual_value"],
+                                                     ForecastedVals=columns["forecast_value"])
+
+        query2 = f"SELECT id, type_name FROM {SCHEMA}.{TABLE_MODEL_METRIC_TYPE};"
+        metric_types = await database.execute_query(query2, cache=True)
+
+        metric_records = [(float(model_errors[type['type_name']]), type['id'], assign_model_id)
+                          for assign_model_id, model_errors in errors.items()
+                          for type in metric_types]
+        inserted = await database.insert_many(TABLE_MODEL_METRIC,
+                                              ["metric_score", "metric_type_id", "assign_model_id"],
+                                              metric_records, schema=SCHEMA)
+        if inserted == None:
+            return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                 detail="Could not store the error metrics")
+
+        model_rows = await database.execute_in_list(lambda in_list: f"""
+                     SELECT {TABLE_ASSIGN_MODEL}.id, {TABLE_MODEL}.model_name
+                     FROM {SCHEMA}.{TABLE_ASSIGN_MODEL}
+                     JOIN {SCHEMA}.{TABLE_MODEL}
+                        ON {TABLE_MODEL}.id = {TABLE_ASSIGN_MODEL}.model_id
+                     WHERE {TABLE_ASSIGN_MODEL}.id IN ({in_list});""", list(errors), cache=True)
+        model_names = {row["id"]: row["model_name"] for row in model_rows or []}
+
+        return {"results": [{**model_errors, "model": model_names.get(assign_model_id),
+                             "assign_model_id": assign_model_id}
+                            for assign_model_id, model_errors in errors.items()],
+                "missing": [assign_model_id for assign_model_id in assign_model_ids if assign_model_id not in errors]}
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except Exception as e:
+        exception_list = traceback.format_exc()
+        exception_list += "\n\n"
+        exception_list += str(e)
+        print('Exception --> ', exception_list)
+
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                             detail="Something went wrong")
@@ -1,16 +1,19 @@
 # Importing Python packages
 import traceback
+from typing import Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_GROUP
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_GROUP
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema, GroupInSchema, GroupSchema, GroupPatchInSchema, GroupPatchSchema
-from internal.funcs import partial_update_query
+from core.schemas.schemas import KeysetPage, UserSchema, GroupInSchema, GroupSchema, GroupPatchInSchema, GroupPatchSchema
+from internal.executors import SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.pagination import decode_cursor, keyset_page
+from internal.reference import groups
 from internal.Token import get_current_active_user
 
 
@@ -45,17 +48,22 @@ async def create_group(record: GroupInSchema,
 
     try:
         # Check if group already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_GROUP} WHERE group_name = '{record.group_name}';"
-        group_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_GROUP} WHERE group_name = $1;"
+        group_result = await database.execute_query(query, record.group_name)
 
         if group_result:
             raise Exception("Group already exists")
 
         query = f"""
                     INSERT INTO {SCHEMA}.{TABLE_GROUP} (group_name, company_name, group_description, active)
-                    VALUES ('{record.group_name}', '{record.company_name}', '{record.group_description}', {record.active})
+                    VALUES ($1, $2, $3, $4)
                 """
-        last_record_id = await database.execute_query(query=query)
+        last_record_id = await database.execute_query(query, record.group_name, record.company_name,
+                                                      record.group_description, record.active)
+        await groups.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -97,8 +105,10 @@ async def get_group(group_id: int,
     print("Calling get_group method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_GROUP} WHERE id = {group_id}"
-        result = await database.execute_query(query=query)
+        result = await groups.get(group_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -110,15 +120,18 @@ async def get_group(group_id: int,
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Id does not exist")
 
-    return result[0]
+    return result
 
 
 # Get all groups from yt_group table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all groups",
-            response_model=Page[GroupSchema],
+            response_model=KeysetPage[GroupSchema],
             response_description="Groups fetched successfully")
-async def get_all_groups(current_user: UserSchema = Security(get_current_active_user,
+async def get_all_groups(cursor: Union[str, None] = None,
+                         size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                         current_user: UserSchema = Security(get_current_active_user,
                                                              scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all groups with following information:
@@ -131,12 +144,21 @@ async def get_all_groups(current_user: UserSchema = Security(get_current_active_
         - **created_at**: Datetime of the group creation. (DATETIME)
         - **updated_at**: Datetime of the group updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from the cached table),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_groups method")
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_GROUP}"
-        result = await database.execute_query(query=query)
+        result = await groups.page(after_key, size + 1)
+        total, total_is_exact = await groups.page_total(total_mode)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -144,7 +166,11 @@ async def get_all_groups(current_user: UserSchema = Security(get_current_active_
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, total=total, total_is_exact=total_is_exact)
 
 
 # Updates single group in yt_group table based on id
@@ -169,11 +195,15 @@ async def update_group(group_id: int, record: GroupInSchema,
     try:
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_GROUP}
-                    SET group_name = '{record.group_name}', company_name = '{record.company_name}',
-                        group_description = '{record.group_description}', active = {record.active}
-                    WHERE id = {group_id}
+                    SET group_name = $1, company_name = $2, group_description = $3, active = $4
+                    WHERE id = $5
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.group_name, record.company_name,
+                                              record.group_description, record.active, group_id)
+        await groups.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -208,15 +238,18 @@ async def partial_update_group(group_id: int, record: GroupPatchInSchema,
     print("Calling partial_update_group method")
 
     try:
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record)
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_GROUP}
                     SET {query_string}
-                    WHERE id = {group_id}
+                    WHERE id = ${len(args) + 1}
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, group_id)
+        await groups.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -246,11 +279,15 @@ async def delete_group(group_id: int,
 
     try:
         # Check if record already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_GROUP} WHERE id = {group_id};"
-        check_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_GROUP} WHERE id = $1;"
+        check_result = await database.execute_query(query, group_id)
+
+        query = f"DELETE FROM {SCHEMA}.{TABLE_GROUP} WHERE id = $1"
+        result = await database.execute_query(query, group_id)
+        await groups.refresh()
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_GROUP} WHERE id = {group_id}"
-        result = await database.execute_query(query=query)
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
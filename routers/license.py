@@ -1,16 +1,19 @@
 # Importing Python packages
 import traceback
+from typing import Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_LICENSE
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_LICENSE
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema, LicenseInSchema, LicenseSchema, LicensePatchInSchema, LicensePatchSchema
-from internal.funcs import partial_update_query
+from core.schemas.schemas import KeysetPage, UserSchema, LicenseInSchema, LicenseSchema, LicensePatchInSchema, LicensePatchSchema
+from internal.executors import SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.pagination import decode_cursor, keyset_page
+from internal.reference import licenses
 from internal.Token import get_current_active_user
 
 
@@ -52,9 +55,14 @@ async def create_license(record: LicenseInSchema,
         
         query = f"""
                     INSERT INTO {SCHEMA}.{TABLE_LICENSE} (license_type, license_issue_date, license_expiry_date)
-                    VALUES ({record.license_type}, '{record.license_issue_date}', '{record.license_expiry_date}')
+                    VALUES ($1, $2, $3)
                 """
-        last_record_id = await database.execute_query(query=query)
+        last_record_id = await database.execute_query(query, record.license_type, record.license_issue_date,
+                                                      record.license_expiry_date)
+        await licenses.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -95,8 +103,10 @@ async def get_license(license_id: int,
     print("Calling get_license method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_LICENSE} WHERE id = {license_id}"
-        result = await database.execute_query(query=query)
+        result = await licenses.get(license_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -108,15 +118,18 @@ async def get_license(license_id: int,
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Id does not exist")
 
-    return result[0]
+    return result
 
 
 # Gets all licenses from yt_license table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all licenses",
-            response_model=Page[LicenseSchema],
+            response_model=KeysetPage[LicenseSchema],
             response_description="Licenses fetched successfully")
-async def get_all_licenses(current_user: UserSchema = Security(get_current_active_user,
+async def get_all_licenses(cursor: Union[str, None] = None,
+                           size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                           total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                           current_user: UserSchema = Security(get_current_active_user,
                                                                scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all licenses with following information:
@@ -128,12 +141,21 @@ async def get_all_licenses(current_user: UserSchema = Security(get_current_activ
         - **created_at**: Datetime of the license creation. (DATETIME)
         - **updated_at**: Datetime of the license updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from the cached table),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_licenses method")
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_LICENSE}"
-        result = await database.execute_query(query=query)
+        result = await licenses.page(after_key, size + 1)
+        total, total_is_exact = await licenses.page_total(total_mode)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -141,7 +163,11 @@ async def get_all_licenses(current_user: UserSchema = Security(get_current_activ
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, total=total, total_is_exact=total_is_exact)
 
 
 # Updates single license in yt_license table based on id
@@ -165,11 +191,15 @@ async def update_license(license_id: int, record: LicenseInSchema,
     try:
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_LICENSE}
-                    SET license_type = {record.license_type}, license_issue_date = '{record.license_issue_date}',
-                        license_expiry_date = '{record.license_expiry_date}'
-                    WHERE id = {license_id}
+                    SET license_type = $1, license_issue_date = $2, license_expiry_date = $3
+                    WHERE id = $4
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.license_type, record.license_issue_date,
+                                              record.license_expiry_date, license_id)
+        await licenses.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -203,15 +233,18 @@ async def partial_update_license(license_id: int, record: LicensePatchInSchema,
     print("Calling partial_update_license method")
 
     try:
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record)
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_LICENSE}
                     SET {query_string}
-                    WHERE id = {license_id}
+                    WHERE id = ${len(args) + 1}
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, license_id)
+        await licenses.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -241,11 +274,15 @@ async def delete_license(license_id: int,
 
     try:
         # Check if record already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_LICENSE} WHERE id = {license_id};"
-        check_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_LICENSE} WHERE id = $1;"
+        check_result = await database.execute_query(query, license_id)
+
+        query = f"DELETE FROM {SCHEMA}.{TABLE_LICENSE} WHERE id = $1"
+        result = await database.execute_query(query, license_id)
+        await licenses.refresh()
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_LICENSE} WHERE id = {license_id}"
-        result = await database.execute_query(query=query)
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
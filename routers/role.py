@@ -1,17 +1,20 @@
 # Importing Python packages
 import traceback
+from typing import Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_ROLE
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_ROLE
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema, RoleInSchema, RoleSchema, RolePatchInSchema, RolePatchSchema
-from internal.funcs import partial_update_query
-from internal.Token import get_current_active_user
+from core.schemas.schemas import KeysetPage, UserSchema, RoleInSchema, RoleSchema, RolePatchInSchema, RolePatchSchema
+from internal.executors import SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.pagination import decode_cursor, keyset_page
+from internal.reference import roles
+from internal.Token import get_current_active_user, RevocationError, revoke_all_principals
 
 
 # Router Object to Create Routes
@@ -42,17 +45,21 @@ async def create_role(record: RoleInSchema,
 
     try:
         # Check if role already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_ROLE} WHERE role_name = '{record.role_name.lower()}';"
-        role_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_ROLE} WHERE role_name = $1;"
+        role_result = await database.execute_query(query, record.role_name.lower())
 
         if role_result:
             raise Exception("Role already exists")
 
         query = f"""
                     INSERT INTO {SCHEMA}.{TABLE_ROLE} (role_name)
-                    VALUES ('{record.role_name.lower()}');
+                    VALUES ($1);
                 """
-        last_record_id = await database.execute_query(query=query)
+        last_record_id = await database.execute_query(query, record.role_name.lower())
+        await roles.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -91,8 +98,10 @@ async def get_role(role_id: int,
     print("Calling get_role method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_ROLE} WHERE id = {role_id};"
-        result = await database.execute_query(query=query)
+        result = await roles.get(role_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -104,15 +113,18 @@ async def get_role(role_id: int,
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Id does not exist")
 
-    return result[0]
+    return result
 
 
 # Get all roles from yt_role table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all roles",
-            response_model=Page[RoleSchema],
+            response_model=KeysetPage[RoleSchema],
             response_description="Roles fetched successfully")
-async def get_all_roles(current_user: UserSchema = Security(get_current_active_user,
+async def get_all_roles(cursor: Union[str, None] = None,
+                        size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                        current_user: UserSchema = Security(get_current_active_user,
                                                             scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all roles with following information:
@@ -122,12 +134,21 @@ async def get_all_roles(current_user: UserSchema = Security(get_current_active_u
         - **created_at**: Datetime of the role creation. (DATETIME)
         - **updated_at**: Datetime of the role updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from the cached table),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_roles method")
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_ROLE};"
-        result = await database.execute_query(query=query)
+        result = await roles.page(after_key, size + 1)
+        total, total_is_exact = await roles.page_total(total_mode)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -135,7 +156,11 @@ async def get_all_roles(current_user: UserSchema = Security(get_current_active_u
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, total=total, total_is_exact=total_is_exact)
 
 
 # Updates a single role in yt_role table based on id
@@ -157,10 +182,19 @@ async def update_role(role_id: int, record: RoleInSchema,
     try:
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_ROLE}
-                    SET role_name = '{record.role_name}'
-                    WHERE id = {role_id};
+                    SET role_name = $1
+                    WHERE id = $2;
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.role_name, role_id)
+        # Cached principals carry the role name
+        await revoke_all_principals()
+        await roles.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -192,15 +226,23 @@ async def partial_update_role(role_id: int, record: RolePatchInSchema,
     print("Calling partial_update_role method")
 
     try:
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record)
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_ROLE}
                     SET {query_string}
-                    WHERE id = {role_id};
+                    WHERE id = ${len(args) + 1};
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, role_id)
+        # Cached principals carry the role name
+        await revoke_all_principals()
+        await roles.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -230,14 +272,23 @@ async def delete_role(role_id: int,
 
     try:
         # Check if record already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_ROLE} WHERE id = {role_id};"
-        check_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_ROLE} WHERE id = $1;"
+        check_result = await database.execute_query(query, role_id)
 
         if not check_result:
             raise Exception("Record does not exist")
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_ROLE} WHERE id = {role_id};"
-        result = await database.execute_query(query=query)
+        query = f"DELETE FROM {SCHEMA}.{TABLE_ROLE} WHERE id = $1;"
+        result = await database.execute_query(query, role_id)
+        # Cached principals carry the role name
+        await revoke_all_principals()
+        await roles.refresh()
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -2,7 +2,7 @@
 from fastapi import APIRouter
 
 # Importing from project files
-from routers import auth, commodity, commodity_group, error_calculator, group, license, role, user, \
+from routers import admin, auth, commodity, commodity_group, error_calculator, group, license, role, user, \
     user_system_description
 
 
@@ -14,6 +14,7 @@ router = APIRouter()
 
 
 # Include all file routes
+router.include_router(admin.router)
 # router.include_router(algo_engine.router)
 # router.include_router(assign_model.router)
 # router.include_router(calendar.router)
@@ -1,21 +1,24 @@
 # Importing Python packages
 import traceback
-from passlib.hash import pbkdf2_sha256
+from typing import List, Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_USER, TABLE_ROLE, TABLE_USER_SYSTEM_DESCRIPTION
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_USER, TABLE_ROLE, TABLE_USER_SYSTEM_DESCRIPTION
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserInSchema, UserSchema, UserPutInSchema, UserPatchInSchema, UserPatchSchema, UserPutInSchema, \
+from core.schemas.schemas import KeysetPage, UserInSchema, UserSchema, UserPutInSchema, UserPatchInSchema, UserPatchSchema, UserPutInSchema, \
     UserSystemDescriptionInSchema, UserSystemDescriptionPatchInSchema
-from internal.funcs import partial_update_query
-from internal.Token import get_current_active_user
-from routers.user_system_description import create_user_system_description, get_user_system_description, \
-    update_user_system_description, partial_update_user_system_description, delete_user_system_description
+from internal.executors import password_hasher, SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.invalidation import invalidation_bus
+from internal.pagination import decode_cursor, keyset_page, page_total
+from internal.singleflight import single_flight
+from internal.Token import get_current_active_user, RevocationError, revoke_principal
+from routers.user_system_description import update_user_system_description, \
+    partial_update_user_system_description, delete_user_system_description
 
 
 # Router Object to Create Routes
@@ -28,6 +31,14 @@ router = APIRouter(
 # ---------------------------------------------------------------------------------------------------
 
 
+# Users joined with their system description and role, as the user list reads them
+USER_RELATION = f"""{SCHEMA}.{TABLE_USER}
+                    JOIN {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}
+                        ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.user_id = {SCHEMA}.{TABLE_USER}.id
+                    JOIN {SCHEMA}.{TABLE_ROLE}
+                        ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.role_id = {SCHEMA}.{TABLE_ROLE}.id"""
+
+
 # Creates a single user in yt_user table
 @router.post('/create/', status_code=status.HTTP_201_CREATED,
              summary="Create a single user",
@@ -57,38 +68,52 @@ async def create_user(record: UserInSchema,
     """
     print("Calling create_user method")
 
-    try:
-        # Check if user already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE username = '{record.username.lower()}';"
-        user_result = await database.execute_query(query=query)
-
-        if user_result:
-            raise Exception("Username already exists")
-            
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE email = '{record.email}';"
-        email_result = await database.execute_query(query=query)
-
-        if email_result:
-            raise Exception("Email already exists")
-        
-        # Create user
-        query = f"""
-                    INSERT INTO {SCHEMA}.{TABLE_USER} (first_name, last_name, contact, email, username, password,
-                                                       company_name, address, city, country, postal_code)
-                    VALUES ('{record.first_name}', '{record.last_name}', '{record.contact}', '{record.email}',
-                            '{record.username.lower()}', '{pbkdf2_sha256.hash(record.password)}', '{record.company_name}',
-                            '{record.address}', '{record.city}', '{record.country}', '{record.postal_code}');
-                """
-        last_record_id = await database.execute_query(query=query)
+    username = record.username.lower()
+    user_result, email_result, user_record = [], [], None
 
-        user_query = f"SELECT * FROM {SCHEMA}.{TABLE_USER} WHERE username = '{record.username.lower()}';"
-        user_record = await database.execute_query(query=user_query)
+    try:
+        # Hashed before the uniqueness check, which is folded into the insert to keep the round trips down
+        password_hash = await password_hasher.hash(record.password)
+
+        # Both inserts share one connection and one transaction
+        async with database.transaction() as con:
+            # Create user, skipped when the username or email is taken
+            query = f"""
+                        INSERT INTO {SCHEMA}.{TABLE_USER} (first_name, last_name, contact, email, username, password,
+                                                           company_name, address, city, country, postal_code)
+                        SELECT $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11
+                        WHERE NOT EXISTS (SELECT 1 FROM {SCHEMA}.{TABLE_USER} WHERE username = $5 OR email = $4);
+                    """
+            await database.execute_in_transaction(con, query, record.first_name, record.last_name, record.contact,
+                                                  record.email, username, password_hash, record.company_name,
+                                                  record.address, record.city, record.country, record.postal_code)
+
+            # The new row is the one carrying this request's salted hash, any other row is a conflict
+            query = f"""
+                        SELECT id, username, email, password = $3 AS created
+                        FROM {SCHEMA}.{TABLE_USER}
+                        WHERE username = $1 OR email = $2;
+                    """
+            existing = await database.execute_in_transaction(con, query, username, record.email, password_hash)
+            created = [row for row in existing if row["created"]]
+            user_result = [row for row in existing if not row["created"] and row["username"] == username]
+            email_result = [row for row in existing if not row["created"] and row["email"] == record.email]
+
+            if not created:
+                raise Exception("Username or email already exists")
+
+            query = f"""
+                        INSERT INTO {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} (user_id, group_id, role_id, license_id)
+                        VALUES ($1, $2, $3, $4);
+                    """
+            await database.execute_in_transaction(con, query, created[0]["id"], record.group_id, record.role_id,
+                                                  record.license_id)
+
+        user_record = created
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
-        await create_user_system_description(record=UserSystemDescriptionInSchema(user_id=user_record[0]["id"],
-                                                                                  group_id=record.group_id,
-                                                                                  role_id=record.role_id,
-                                                                                  license_id=record.license_id))
-    
     except Exception as e:
         exception_list = traceback.format_exc()
         exception_list += "\n\n"
@@ -103,13 +128,118 @@ async def create_user(record: UserInSchema,
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail="Email already exists")
 
-    if last_record_id == None:
+    if not user_record:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Something went wrong")
-    
+
+    invalidation_bus.publish(TABLE_USER, user_record[0]["id"])
     return {**record.dict(), "id": user_record[0]["id"]}
 
 
+# Creates many users in yt_user table at once
+@router.post('/create/bulk/', status_code=status.HTTP_201_CREATED,
+             summary="Create many users at once",
+             response_description="Users created, rows that could not be created are reported in errors")
+async def create_users_bulk(records: List[UserInSchema],
+                            current_user: UserSchema = Security(get_current_active_user,
+                                                                scopes=[Role.REPORTING_USER['name']])) -> dict:
+    """
+        Create many users, each with the same information as a single user creation.
+
+        Returns `created` with the created users and their ids, and `errors` with the
+        `index`, `username` and `detail` of every row that was skipped.
+
+    """
+    print("Calling create_users_bulk method")
+
+    errors = []
+    usernames, emails = set(), set()
+    candidates = []
+    for index, record in enumerate(records):
+        username = record.username.lower()
+        if username in usernames:
+            errors.append({"index": index, "username": username, "detail": "Duplicate username in request"})
+        elif record.email in emails:
+            errors.append({"index": index, "username": username, "detail": "Duplicate email in request"})
+        else:
+            usernames.add(username)
+            emails.add(record.email)
+            candidates.append((index, username, record))
+
+    try:
+        # Set-based uniqueness checks against the table, a statement per IN list
+        taken_usernames = await database.execute_in_list(
+            lambda in_list: f"SELECT username FROM {SCHEMA}.{TABLE_USER} WHERE username IN ({in_list});", usernames)
+        taken_emails = await database.execute_in_list(
+            lambda in_list: f"SELECT email FROM {SCHEMA}.{TABLE_USER} WHERE email IN ({in_list});", emails)
+        if taken_usernames is None or taken_emails is None:
+            raise Exception("Uniqueness check failed")
+        taken_usernames = {row["username"] for row in taken_usernames}
+        taken_emails = {row["email"] for row in taken_emails}
+
+        new_users = []
+        for index, username, record in candidates:
+            if username in taken_usernames:
+                errors.append({"index": index, "username": username, "detail": "Username already exists"})
+            elif record.email in taken_emails:
+                errors.append({"index": index, "username": username, "detail": "Email already exists"})
+            else:
+                new_users.append((username, record))
+
+        password_hashes = await password_hasher.hash_many([record.password for _, record in new_users])
+
+        created = []
+        if new_users:
+            async with database.transaction() as con:
+                await database.insert_many(TABLE_USER,
+                                           ["first_name", "last_name", "contact", "email", "username", "password",
+                                            "company_name", "address", "city", "country", "postal_code"],
+                                           [(record.first_name, record.last_name, record.contact, record.email,
+                                             username, password_hash, record.company_name, record.address,
+                                             record.city, record.country, record.postal_code)
+                                            for (username, record), password_hash in zip(new_users, password_hashes)],
+                                           schema=SCHEMA, con=con)
+
+                rows = await database.execute_in_list(
+                    lambda in_list: f"SELECT id, username FROM {SCHEMA}.{TABLE_USER} WHERE username IN ({in_list});",
+                    [username for username, _ in new_users], con=con)
+                ids = {}
+                for row in rows:
+                    ids.setdefault(row["username"], []).append(row["id"])
+
+                # Every new username has to match exactly one row, or the descriptions go to the wrong users
+                unresolved = [username for username, _ in new_users if len(ids.get(username, ())) != 1]
+                if unresolved:
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                        detail=f"Could not resolve a single id for: {', '.join(unresolved)}")
+                ids = {username: user_ids[0] for username, user_ids in ids.items()}
+
+                await database.insert_many(TABLE_USER_SYSTEM_DESCRIPTION,
+                                           ["user_id", "group_id", "role_id", "license_id"],
+                                           [(ids[username], record.group_id, record.role_id, record.license_id)
+                                            for username, record in new_users],
+                                           schema=SCHEMA, con=con)
+
+            created = [UserSchema(**record.dict(), id=ids[username]) for username, record in new_users]
+
+    except HTTPException:
+        raise
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except Exception as e:
+        exception_list = traceback.format_exc()
+        exception_list += "\n\n"
+        exception_list += str(e)
+        print('Exception --> ', exception_list)
+
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return {"created": created, "errors": sorted(errors, key=lambda error: error["index"])}
+
+
 # Gets a single user from yt_user table based on id
 @router.get('/{user_id}/', status_code=status.HTTP_200_OK,
             summary="Get a single user by providing Id",
@@ -140,15 +270,15 @@ async def get_user(user_id: int,
 
     """
     print("Calling get_user method")
-    
+    result, user_system_desc = None, None
+
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER} WHERE id = {user_id};"
-        result = await database.execute_query(query=query)
+        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER} WHERE id = $1;"
+        query2 = f"SELECT group_id, role_id, license_id FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = $1;"
+        result, user_system_desc = await database.execute_concurrently((query, user_id), (query2, user_id))
 
-        user_system_desc = await get_user_system_description(user_id=user_id)
-        del user_system_desc["user_id"]
-        del user_system_desc["created_at"]
-        del user_system_desc["updated_at"]
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -156,19 +286,23 @@ async def get_user(user_id: int,
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    if not result:
+    if not result or not user_system_desc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Id does not exist")
 
-    return {**result[0], **user_system_desc}
+    return {**result[0], **user_system_desc[0]}
 
 
 # Get all users from yt_user table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all users",
-            response_model=Page[UserSchema],
+            response_model=KeysetPage[UserSchema],
             response_description="Users fetched successfully")
-async def get_all_users(current_user: UserSchema = Security(get_current_active_user,
+@single_flight(tables=(TABLE_USER, TABLE_USER_SYSTEM_DESCRIPTION, TABLE_ROLE))
+async def get_all_users(cursor: Union[str, None] = None,
+                        size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                        current_user: UserSchema = Security(get_current_active_user,
                                                             scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all users with following information:
@@ -190,18 +324,28 @@ async def get_all_users(current_user: UserSchema = Security(get_current_active_u
         - **created_at**: Datetime of the user creation. (DATETIME)
         - **updated_at**: Datetime of the user updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from cached counts or table statistics),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_users method")
-    
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
+
     try:
         query = f"""SELECT {SCHEMA}.{TABLE_USER}.*, {SCHEMA}.{TABLE_ROLE}.role_name, {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.*
-                    FROM {SCHEMA}.{TABLE_USER}
-                    JOIN {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}
-                        ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.user_id = {SCHEMA}.{TABLE_USER}.id
-                    JOIN {SCHEMA}.{TABLE_ROLE}
-                        ON {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}.role_id = {SCHEMA}.{TABLE_ROLE}.id;
+                    FROM {USER_RELATION}
+                    WHERE {SCHEMA}.{TABLE_USER}.id > $1
+                    ORDER BY {SCHEMA}.{TABLE_USER}.id
+                    LIMIT $2;
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, after_key, size + 1)
+        # Users are listed with their description and role, so that join is counted, estimated from the descriptions
+        total, total_is_exact = await page_total(TABLE_USER_SYSTEM_DESCRIPTION, total_mode, relation=USER_RELATION)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -209,7 +353,11 @@ async def get_all_users(current_user: UserSchema = Security(get_current_active_u
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, total=total, total_is_exact=total_is_exact)
 
 
 # Updates single user from yt_user table based on id
@@ -242,40 +390,45 @@ async def update_user(user_id: int, record: UserPutInSchema,
     
     try:
         # Check if user exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE id = {user_id};"
-        id_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE id = $1;"
+        id_query = await database.execute_query(query, user_id)
         
         if not id_query:
             raise Exception("Id does not exist")
 
         # Check if username already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE username = '{record.username.lower()}';"
-        user_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE username = $1;"
+        user_query = await database.execute_query(query, record.username.lower())
 
         if user_query:
             raise Exception("Username already exists")
         
         # Check if email already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE email = '{record.email}';"
-        email_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE email = $1;"
+        email_query = await database.execute_query(query, record.email)
 
         if email_query:
             raise Exception("Email already exists")
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_USER}
-                    SET first_name = '{record.first_name}', last_name = '{record.last_name}', contact = '{record.contact}',
-                        email = '{record.email}', company_name = '{record.company_name}', address = '{record.address}',
-                        city = '{record.city}', country = '{record.country}', postal_code = '{record.postal_code}'
-                    WHERE id = {user_id}
+                    SET first_name = $1, last_name = $2, contact = $3, email = $4, company_name = $5, address = $6,
+                        city = $7, country = $8, postal_code = $9
+                    WHERE id = $10
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.first_name, record.last_name, record.contact,
+                                              record.email, record.company_name, record.address, record.city,
+                                              record.country, record.postal_code, user_id)
+        invalidation_bus.publish(TABLE_USER, user_id)
 
         await update_user_system_description(user_id=user_id, record=UserSystemDescriptionInSchema(user_id=user_id,
                                                                                                    group_id=record.group_id,
                                                                                                    role_id=record.role_id,
                                                                                                    license_id=record.license_id))
 
+    except SERVER_BUSY_ERRORS:
+        raise
+
     except Exception as e:
         exception_list = traceback.format_exc()
         exception_list += "\n\n"
@@ -328,42 +481,44 @@ async def partial_update_user(user_id: int, record: UserPatchInSchema,
     
     try:
         # Check if user exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE id = {user_id};"
-        id_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE id = $1;"
+        id_query = await database.execute_query(query, user_id)
         
         if not id_query:
             raise Exception("Id does not exist")
 
         # Check if username already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE username = '{record.username.lower()}';"
-        user_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE username = $1;"
+        user_query = await database.execute_query(query, record.username.lower())
 
         if user_query:
             raise Exception("Username already exists")
         
         # Check if email already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE email = '{record.email}';"
-        email_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE email = $1;"
+        email_query = await database.execute_query(query, record.email)
 
         if email_query:
             raise Exception("Email already exists")
             
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.replace(", group_id=0, role_id=0, license_id=0", "")
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record, exclude=("group_id", "role_id", "license_id"))
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_USER}
                     SET {query_string}
-                    WHERE id = {user_id};
+                    WHERE id = ${len(args) + 1};
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, user_id)
+        invalidation_bus.publish(TABLE_USER, user_id)
 
         await partial_update_user_system_description(user_id=user_id, record=UserSystemDescriptionPatchInSchema(user_id=user_id,
                                                                                                                 group_id=record.group_id,
                                                                                                                 role_id=record.role_id,
                                                                                                                 license_id=record.license_id))
 
+    except SERVER_BUSY_ERRORS:
+        raise
+
     except Exception as e:
         exception_list = traceback.format_exc()
         exception_list += "\n\n"
@@ -404,17 +559,24 @@ async def delete_user(user_id: int,
     
     try:
         # Check if user exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE id = {user_id};"
-        id_query = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER} WHERE id = $1;"
+        id_query = await database.execute_query(query, user_id)
 
         if not id_query:
             raise Exception("Id does not exist")
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_USER} WHERE id = {user_id}"
-        result = await database.execute_query(query=query)
+        query = f"DELETE FROM {SCHEMA}.{TABLE_USER} WHERE id = $1"
+        result = await database.execute_query(query, user_id)
+        await revoke_principal(user_id)
         
         await delete_user_system_description(user_id=user_id)
 
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
+
     except Exception as e:
         exception_list = traceback.format_exc()
         exception_list += "\n\n"
@@ -1,18 +1,20 @@
 # Importing Python packages
 import traceback
+from typing import Union
 
 # Importing FastAPI packages
-from fastapi import APIRouter, Response, status, HTTPException, Security
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Query, Response, status, HTTPException, Security
 
 # Importing from project files
-from api_parameters import SCHEMA, TABLE_USER_SYSTEM_DESCRIPTION
+from api_parameters import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SCHEMA, TABLE_USER_SYSTEM_DESCRIPTION
 from core.models.database import database
 from core.scopes.set_scope import Role
-from core.schemas.schemas import UserSchema, UserSystemDescriptionInSchema, UserSystemDescriptionSchema, \
+from core.schemas.schemas import KeysetPage, UserSchema, UserSystemDescriptionInSchema, UserSystemDescriptionSchema, \
     UserSystemDescriptionPatchInSchema, UserSystemDescriptionPatchSchema
-from internal.funcs import partial_update_query
-from internal.Token import get_current_active_user
+from internal.executors import SERVER_BUSY_ERRORS
+from internal.funcs import partial_update_params
+from internal.pagination import decode_cursor, keyset_page, page_total
+from internal.Token import get_current_active_user, RevocationError, revoke_principal
 
 
 # Router Object to Create Routes
@@ -47,9 +49,17 @@ async def create_user_system_description(record: UserSystemDescriptionInSchema,
     try:
         query = f"""
                     INSERT INTO {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} (user_id, group_id, role_id, license_id)
-                    VALUES ({record.user_id}, {record.group_id}, {record.role_id}, {record.license_id})
+                    VALUES ($1, $2, $3, $4)
                 """
-        last_record_id = await database.execute_query(query=query)
+        last_record_id = await database.execute_query(query, record.user_id, record.group_id, record.role_id,
+                                                      record.license_id)
+        await revoke_principal(record.user_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -86,8 +96,11 @@ async def get_user_system_description(user_id: int,
     print("Calling get_user_system_description method")
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = {user_id}"
-        result = await database.execute_query(query=query)
+        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = $1"
+        result = await database.execute_query(query, user_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -105,9 +118,12 @@ async def get_user_system_description(user_id: int,
 # Gets all user_system_description from yt_user_system_description table
 @router.get('/', status_code=status.HTTP_200_OK,
             summary="Get all user system descriptions",
-            response_model=Page[UserSystemDescriptionSchema],
+            response_model=KeysetPage[UserSystemDescriptionSchema],
             response_description="User System Descriptions fetched successfully")
-async def get_all_user_system_descriptions(current_user: UserSchema = Security(get_current_active_user,
+async def get_all_user_system_descriptions(cursor: Union[str, None] = None,
+                                           size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                           total_mode: str = Query("approximate", regex="^(none|approximate|exact)$"),
+                                           current_user: UserSchema = Security(get_current_active_user,
                                                                                scopes=[Role.REPORTING_USER['name']])) -> dict:
     """
         Get all user system descriptions with following information:
@@ -119,12 +135,22 @@ async def get_all_user_system_descriptions(current_user: UserSchema = Security(g
         - **created_at**: Datetime of the user system description creation. (DATETIME)
         - **updated_at**: Datetime of the user system description updation. (DATETIME)
 
+        Pass `next_cursor` of a page as `cursor` to get the next page of `size` rows.
+        `total_mode` picks the page `total`: `approximate` (default, from cached counts or table statistics),
+        `exact` (COUNT on every request) or `none`. `total_is_exact` tells which one was returned.
+
     """
     print("Calling get_all_user_system_descriptions method")
+    after_key = decode_cursor(cursor)
+    result, total, total_is_exact = None, None, None
 
     try:
-        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}"
-        result = await database.execute_query(query=query)
+        query = f"SELECT * FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id > $1 ORDER BY user_id LIMIT $2;"
+        result = await database.execute_query(query, after_key, size + 1)
+        total, total_is_exact = await page_total(TABLE_USER_SYSTEM_DESCRIPTION, total_mode)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -132,7 +158,11 @@ async def get_all_user_system_descriptions(current_user: UserSchema = Security(g
         exception_list += str(e)
         print('Exception --> ', exception_list)
 
-    return paginate(result)
+    if result == None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Something went wrong")
+
+    return keyset_page(result, size, key="user_id", total=total, total_is_exact=total_is_exact)
 
 
 # Updates a single user_system_description in yt_user_system_description table based on user_id
@@ -157,11 +187,19 @@ async def update_user_system_description(user_id: int, record: UserSystemDescrip
     try:
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}
-                    SET user_id = {record.user_id}, group_id = {record.group_id},
-                        role_id = {record.role_id}, license_id = {record.license_id}
-                    WHERE user_id = {user_id}
+                    SET user_id = $1, group_id = $2, role_id = $3, license_id = $4
+                    WHERE user_id = $5
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, record.user_id, record.group_id, record.role_id,
+                                              record.license_id, user_id)
+        await revoke_principal(user_id)
+        await revoke_principal(record.user_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -197,15 +235,21 @@ async def partial_update_user_system_description(user_id: int,
     print("Calling partial_update_user_system_description method")
 
     try:
-        query_string = " ".join(map(partial_update_query, record))
-        query_string = query_string.strip()[:-1]
+        query_string, args = await partial_update_params(record)
         
         query = f"""
                     UPDATE {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION}
                     SET {query_string}
-                    WHERE user_id = {user_id}
+                    WHERE user_id = ${len(args) + 1}
                 """
-        result = await database.execute_query(query=query)
+        result = await database.execute_query(query, *args, user_id)
+        await revoke_principal(user_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
+
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
@@ -235,11 +279,18 @@ async def delete_user_system_description(user_id: int,
 
     try:
         # Check if record already exists
-        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = {user_id};"
-        check_result = await database.execute_query(query=query)
+        query = f"SELECT id FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = $1;"
+        check_result = await database.execute_query(query, user_id)
+
+        query = f"DELETE FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = $1;"
+        result = await database.execute_query(query, user_id)
+        await revoke_principal(user_id)
+
+    except SERVER_BUSY_ERRORS:
+        raise
 
-        query = f"DELETE FROM {SCHEMA}.{TABLE_USER_SYSTEM_DESCRIPTION} WHERE user_id = {user_id};"
-        result = await database.execute_query(query=query)
+    except RevocationError:
+        raise
 
     except Exception as e:
         exception_list = traceback.format_exc()
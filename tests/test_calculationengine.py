@@ -0,0 +1,122 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from internal.calculationengine import CalculationEngine, ErrorAccumulator
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_calculationengine.py
+
+
+def forecast_table(actual, forecast, assign_model_id=1):
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE yt_model_forecast (assign_model_id INTEGER, forecast_value REAL, actual_value REAL)")
+    con.executemany("INSERT INTO yt_model_forecast VALUES (?, ?, ?)",
+                    [(assign_model_id, float(f), float(a)) for a, f in zip(actual, forecast)])
+    # Noise rows for another model must not leak into the aggregates
+    con.execute("INSERT INTO yt_model_forecast VALUES (?, 1000.0, 1.0)", (assign_model_id + 1,))
+    return con
+
+
+def sql_errors(con, assign_model_id=1):
+    con.row_factory = sqlite3.Row
+    query = CalculationEngine.error_query("yt_model_forecast")
+    row = con.execute(query, {"1": assign_model_id}).fetchone()
+    return dict(row)
+
+
+# ### ERROR CALCULATOR ###
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_error_query_matches_numpy(seed):
+    rng = np.random.default_rng(seed)
+    actual = pd.Series(rng.uniform(10, 500, size=1000))
+    forecast = pd.Series(actual * rng.uniform(0.8, 1.2, size=1000))
+
+    expected = CalculationEngine.error_calculator(ActualVals=actual, ForecastedVals=forecast)
+    row = sql_errors(forecast_table(actual, forecast))
+
+    assert row["n"] == 1000
+    assert set(row) == {"n", "mape", "mse", "rmse", "mae", "wape"}
+    result = CalculationEngine.error_from_aggregates(row)
+    for metric, value in expected.items():
+        assert result[metric] == pytest.approx(float(value), rel=1e-9)
+
+
+def test_error_calculator_accepts_arrays():
+    rng = np.random.default_rng(3)
+    actual = rng.uniform(10, 500, size=100)
+    forecast = actual * rng.uniform(0.8, 1.2, size=100)
+
+    from_series = CalculationEngine.error_calculator(ActualVals=pd.Series(actual), ForecastedVals=pd.Series(forecast))
+    from_arrays = CalculationEngine.error_calculator(ActualVals=actual, ForecastedVals=forecast)
+
+    assert from_arrays == pytest.approx(from_series)
+
+
+def test_grouped_error_calculator_matches_per_group():
+    rng = np.random.default_rng(4)
+    keys = rng.integers(1, 6, size=2000)
+    actual = rng.uniform(10, 500, size=2000)
+    forecast = actual * rng.uniform(0.8, 1.2, size=2000)
+
+    grouped = CalculationEngine.grouped_error_calculator(Keys=keys, ActualVals=actual, ForecastedVals=forecast)
+
+    assert sorted(grouped) == sorted(np.unique(keys).tolist())
+    for key, metrics in grouped.items():
+        mask = keys == key
+        expected = CalculationEngine.error_calculator(ActualVals=actual[mask], ForecastedVals=forecast[mask])
+        assert metrics == pytest.approx(expected)
+
+
+def test_error_kernel_matches_reference_formulas():
+    rng = np.random.default_rng(5)
+    actual = rng.uniform(10, 500, size=500)
+    forecast = actual * rng.uniform(0.8, 1.2, size=500)
+    buffer = CalculationEngine.error_buffer(1000)
+
+    result = CalculationEngine.error_kernel(actual, forecast, seasonality=7, out=buffer)
+
+    residual = actual - forecast
+    assert result["MAPE"] == pytest.approx(np.mean(np.abs(residual / actual)) * 100)
+    assert result["MSE"] == pytest.approx(np.mean(residual ** 2))
+    assert result["RMSE"] == pytest.approx(np.sqrt(np.mean(residual ** 2)))
+    assert result["MAE"] == pytest.approx(np.mean(np.abs(residual)))
+    assert result["WAPE"] == pytest.approx(np.abs(residual).sum() / actual.sum())
+    assert result["sMAPE"] == pytest.approx(np.mean(2 * np.abs(residual) / (np.abs(actual) + np.abs(forecast))) * 100)
+    assert result["MASE"] == pytest.approx(np.mean(np.abs(residual)) / np.mean(np.abs(actual[7:] - actual[:-7])))
+    assert result["Bias"] == pytest.approx(np.mean(forecast - actual))
+    # Inputs are left untouched when the workspace is reused
+    assert CalculationEngine.error_kernel(actual, forecast, seasonality=7, out=buffer) == pytest.approx(result)
+
+
+@pytest.mark.parametrize("seasonality", [1, 3, 12])
+def test_error_accumulator_matches_in_memory(seasonality):
+    rng = np.random.default_rng(6)
+    actual = rng.uniform(10, 500, size=1000)
+    forecast = actual * rng.uniform(0.8, 1.2, size=1000)
+    expected = CalculationEngine.error_kernel(actual, forecast, seasonality=seasonality)
+
+    # Uneven chunks, including ones shorter than the seasonality
+    bounds = [0, 2, 130, 131, 500, 1000]
+    chunked = ErrorAccumulator(seasonality)
+    for start, end in zip(bounds, bounds[1:]):
+        chunked.update(actual[start:end], forecast[start:end])
+
+    # Two workers over contiguous halves, merged in order
+    first = ErrorAccumulator(seasonality).update(actual[:400], forecast[:400])
+    second = ErrorAccumulator(seasonality).update(actual[400:], forecast[400:])
+    merged = first.merge(second)
+
+    assert chunked.result() == pytest.approx(expected, rel=1e-9)
+    assert merged.result() == pytest.approx(expected, rel=1e-9)
+
+
+def test_error_query_no_rows():
+    row = sql_errors(forecast_table([], []))
+
+    assert row["n"] == 0
+
+# ### ERROR CALCULATOR ###
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+from passlib.hash import pbkdf2_sha256
+
+import internal.executors as executors
+from internal.executors import HasherBusyError, PasswordHasher
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_executors.py
+
+
+# ### PASSWORD HASHER ###
+def test_full_queue_raises_hasher_busy():
+    async def scenario():
+        hasher = PasswordHasher(workers=1, queue_limit=2)
+        try:
+            running = [asyncio.ensure_future(hasher.hash("password")) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(HasherBusyError):
+                await hasher.hash("password")
+            await asyncio.gather(*running)
+            # Room again once the queue drained
+            await hasher.hash("password")
+            return hasher.stats()
+        finally:
+            hasher.shutdown()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 1 and stats["completed"] == 3 and stats["max_pending"] == 2 and stats["pending"] == 0
+
+
+def test_hash_many_runs_chunks_in_parallel_beside_logins(monkeypatch):
+    def hash_passwords(passwords):
+        time.sleep(0.05)
+        return [f"hash:{password}" for password in passwords]
+
+    monkeypatch.setattr(executors, "hash_passwords", hash_passwords)
+    passwords = [f"password{index}" for index in range(4 * PasswordHasher.BULK_CHUNK_SIZE)]
+    password_hash = pbkdf2_sha256.hash("password")
+
+    async def scenario():
+        hasher = PasswordHasher(workers=1, queue_limit=1, bulk_workers=4)
+        try:
+            started = time.perf_counter()
+            bulk = asyncio.ensure_future(hasher.hash_many(passwords))
+            await asyncio.sleep(0.01)
+            # The bulk batch takes nothing from the login queue
+            login = await hasher.verify("password", password_hash)
+            hashed = await bulk
+            return hashed, login, time.perf_counter() - started, hasher.stats()
+        finally:
+            hasher.shutdown()
+
+    hashed, login, seconds, stats = asyncio.run(scenario())
+
+    assert hashed == [f"hash:{password}" for password in passwords]
+    assert login
+    # Four chunks on four workers take about as long as one
+    assert seconds < 0.15
+    assert stats["completed"] == len(passwords) + 1 and stats["rejected"] == 0 and stats["bulk_pending"] == 0
+
+# ### PASSWORD HASHER ###
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import asyncpg
+
+from core.models.database import database
+from internal.invalidation import QUERY_RESULTS, InvalidationBus, invalidation_bus
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_invalidation.py
+
+
+# ### INVALIDATION BUS ###
+def test_publish_and_remote_messages_reach_handlers():
+    async def scenario():
+        bus = InvalidationBus("test_channel")
+        evicted = []
+        bus.subscribe("yt_user", evicted.append)
+        await bus.start()
+        try:
+            bus.publish("yt_user", 7)
+            # A message from another worker, and this worker's own echo which is skipped
+            bus._on_notify(None, 0, "test_channel", json.dumps({"origin": "other", "table": "yt_user", "key": None}))
+            bus._on_notify(None, 0, "test_channel", json.dumps({"origin": bus.origin, "table": "yt_user", "key": 7}))
+            bus._on_notify(None, 0, "test_channel", json.dumps({"origin": "other", "table": "yt_role", "key": 1}))
+            await asyncio.sleep(0.01)
+        finally:
+            await bus.stop()
+        return evicted, bus.stats()
+
+    evicted, stats = asyncio.run(scenario())
+    assert evicted == [7, None]
+    assert stats["published"] == 1
+    assert stats["received"] == 2
+
+
+def test_result_cache_writes_are_published_and_received():
+    cache = database.result_cache
+    cache.set("role", [{"role_name": "admin"}], {"yt_role"}, cache.generation({"yt_role"}))
+    published, invalidations = invalidation_bus.published, cache.stats()["invalidations"]
+
+    # A write on this worker evicts here once and is published for the other workers
+    database.invalidate_tables({"yt_role"})
+    assert cache.get("role") is None and invalidation_bus.published == published + 1
+    assert cache.stats()["invalidations"] == invalidations + 1
+
+    # A write on another worker
+    cache.set("role", [{"role_name": "admin"}], {"yt_role"}, cache.generation({"yt_role"}))
+    invalidation_bus._dispatch(QUERY_RESULTS, ["yt_role"])
+    assert cache.get("role") is None
+
+
+def test_connection_without_listen_is_closed(monkeypatch):
+    class Connection:
+        closed = False
+
+        async def add_listener(self, channel, callback):
+            raise asyncpg.exceptions.FeatureNotSupportedError("LISTEN is not supported")
+
+        async def close(self):
+            self.closed = True
+
+    connection = Connection()
+
+    async def connect(**kwargs):
+        return connection
+
+    monkeypatch.setattr(asyncpg, "connect", connect)
+
+    async def scenario():
+        bus = InvalidationBus("test_channel")
+        await bus.start()
+        try:
+            return bus.remote, connection.closed, database._listen_connection
+        finally:
+            await bus.stop()
+
+    assert asyncio.run(scenario()) == (False, True, None)
+
+# ### INVALIDATION BUS ###
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import HTTPException
+
+from internal.pagination import decode_cursor, encode_cursor, keyset_page
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_pagination.py
+
+
+# ### KEYSET PAGINATION ###
+def test_cursor_round_trip():
+    assert decode_cursor(None) == 0
+    assert decode_cursor(encode_cursor(1234)) == 1234
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor("12"), "e30="])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_keyset_page_walks_all_rows():
+    table = [{"id": key} for key in range(1, 8)]
+    seen, cursor = [], None
+    while True:
+        after_key = decode_cursor(cursor)
+        rows = [row for row in table if row["id"] > after_key][:3 + 1]
+        page = keyset_page(rows, 3)
+        seen += [row["id"] for row in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(1, 8))
+
+# ### KEYSET PAGINATION ###
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+import main
+from core.models.database import database
+from core.models.db import Database, PoolBusyError
+from internal.Token import get_current_active_user
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_pool.py
+
+
+class FakePool:
+    def __init__(self, size):
+        self.free = asyncio.Semaphore(size)
+
+    async def acquire(self, timeout=None):
+        await asyncio.wait_for(self.free.acquire(), timeout)
+        return object()
+
+    async def release(self, con):
+        self.free.release()
+
+    def get_size(self):
+        return 1
+
+    def get_idle_size(self):
+        return self.free._value
+
+
+def get(url):
+    async def request():
+        async with AsyncClient(app=main.app, base_url="http://test") as client:
+            return await client.get(url)
+
+    return asyncio.run(request())
+
+
+# ### CONNECTION POOL ###
+def test_acquire_rejects_waiters_beyond_the_limit_and_times_out():
+    async def scenario():
+        pool_database = Database("user", "password", "host", "database", 5432, max_waiters=2, acquire_timeout=0.05)
+        pool_database._connection_pool = FakePool(1)
+        held = await pool_database._acquire()
+        waiting = [asyncio.ensure_future(pool_database._acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        saturated = pool_database.pool_saturated()
+        with pytest.raises(PoolBusyError):
+            await pool_database._acquire()
+        timed_out = await asyncio.gather(*waiting, return_exceptions=True)
+        await pool_database._release(held)
+        return saturated, timed_out, pool_database.pool_stats()
+
+    saturated, timed_out, stats = asyncio.run(scenario())
+    assert saturated
+    assert all(isinstance(error, PoolBusyError) for error in timed_out)
+    assert stats["rejected"] == 1 and stats["timeouts"] == 2
+    assert stats["waiters"] == 0 and stats["in_use"] == 0
+
+
+def test_saturated_pool_answers_503(monkeypatch):
+    monkeypatch.setitem(main.app.dependency_overrides, get_current_active_user, lambda: None)
+    monkeypatch.setattr(database, "max_waiters", 0)
+
+    response = get("/commodity/1/")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_acquire_timeout_in_a_route_answers_503(monkeypatch):
+    monkeypatch.setitem(main.app.dependency_overrides, get_current_active_user, lambda: None)
+    monkeypatch.setattr(database, "max_waiters", 4)
+    monkeypatch.setattr(database, "acquire_timeout", 0.01)
+    monkeypatch.setattr(database, "_connection_pool", FakePool(0))
+
+    response = get("/commodity/1/")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {"detail": "Server is busy, please try again"}
+
+# ### CONNECTION POOL ###
@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from core.models.db import Database, QueryResultCache, normalize_query, query_tables
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_query_cache.py
+
+
+MODEL_NAME_QUERY = """SELECT model_name
+                      FROM yhat_db.yt_model
+                      WHERE id IN (SELECT model_id FROM yhat_db.yt_assign_model WHERE id = $1);"""
+
+
+# ### QUERY RESULT CACHE ###
+def test_query_text_helpers():
+    assert query_tables(MODEL_NAME_QUERY) == {"yt_model", "yt_assign_model"}
+    assert query_tables("INSERT INTO yhat_db.yt_model_metric (metric_score) VALUES ($1)") == {"yt_model_metric"}
+    assert query_tables('UPDATE "yhat_db"."yt_role" SET role_name = $1') == {"yt_role"}
+    assert normalize_query("SELECT  *\n  FROM yt_role;") == normalize_query("SELECT * FROM yt_role")
+
+
+def test_write_invalidates_dependent_entries_only():
+    cache = QueryResultCache(max_bytes=1 << 20, ttl=60)
+    tables = query_tables(MODEL_NAME_QUERY)
+    cache.set("model", [{"model_name": "lstm"}], tables, cache.generation(tables))
+    cache.set("role", [{"role_name": "admin"}], {"yt_role"}, cache.generation({"yt_role"}))
+    assert cache.get("model") == [{"model_name": "lstm"}]
+
+    cache.invalidate_tables({"yt_assign_model"})
+    assert cache.get("model") is None
+    assert cache.get("role") == [{"role_name": "admin"}]
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["invalidations"] == 1 and stats["hits"] == 2
+
+
+def test_read_overlapping_a_write_is_not_stored():
+    cache = QueryResultCache(max_bytes=1 << 20, ttl=60)
+    generation = cache.generation({"yt_model"})
+    cache.invalidate_tables({"yt_model"})
+    cache.set("model", [{"model_name": "stale"}], {"yt_model"}, generation)
+    assert cache.get("model") is None
+
+
+def test_entries_expire_and_respect_byte_bound():
+    cache = QueryResultCache(max_bytes=4096, ttl=60, table_ttls={"yt_model": 0})
+    cache.set("model", [{"id": 1}], {"yt_model"}, cache.generation({"yt_model"}))
+    assert cache.get("model") is None
+
+    for key in range(100):
+        cache.set(key, [{"id": key, "name": "x" * 50}], {"yt_role"}, cache.generation({"yt_role"}))
+    stats = cache.stats()
+    assert 0 < stats["bytes"] <= 4096 and stats["evictions"] > 0
+    assert cache.get(99) is not None and cache.get(0) is None
+
+
+class FakeConnection:
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetch_prepared(self, query, *args):
+        return []
+
+
+class FakePool:
+    async def acquire(self, timeout=None):
+        return FakeConnection()
+
+    async def release(self, con):
+        pass
+
+
+def test_transaction_writes_invalidate_on_commit_only():
+    database = Database("user", "password", "host", "database", 5432)
+    database._connection_pool = FakePool()
+    database.result_cache.set("role", [{"role_name": "admin"}], {"yt_role"}, database.result_cache.generation({"yt_role"}))
+
+    async def write(fail):
+        async with database.transaction() as con:
+            await database.execute_in_transaction(con, "UPDATE yhat_db.yt_role SET role_name = $1", "user")
+            assert database.result_cache.get("role") is not None
+            if fail:
+                raise ValueError("rolled back")
+
+    with pytest.raises(ValueError):
+        asyncio.run(write(fail=True))
+    assert database.result_cache.get("role") is not None
+
+    asyncio.run(write(fail=False))
+    assert database.result_cache.get("role") is None
+    assert database.query_stats.top()[0]["calls"] == 2
+
+# ### QUERY RESULT CACHE ###
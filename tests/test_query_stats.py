@@ -0,0 +1,37 @@
+import logging
+
+from core.models.db import QueryStats, fingerprint
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_query_stats.py
+
+
+# ### QUERY STATS ###
+def test_fingerprint_ignores_literals_and_whitespace():
+    assert fingerprint("SELECT * FROM yt_role WHERE id = 1;") == fingerprint("SELECT *\n FROM yt_role WHERE id = 22")
+    assert fingerprint("SELECT * FROM yt_user WHERE username = 'a'")[0] == \
+        fingerprint("SELECT * FROM yt_user WHERE username = 'it''s'")[0]
+    assert fingerprint("SELECT * FROM yt_role")[0] != fingerprint("SELECT * FROM yt_group")[0]
+
+
+def test_stats_aggregate_per_statement_and_log_slow_queries(caplog):
+    stats = QueryStats(slow_query_seconds=0.5, max_statements=2)
+    for _ in range(9):
+        stats.record("SELECT * FROM yt_role WHERE id = $1", 0.001, 0.002, 0.001, 1)
+    with caplog.at_level(logging.WARNING, logger="foo-logger"):
+        stats.record("SELECT * FROM yt_role WHERE id = $1", 0.0, 2.0, 0.0, 1)
+        stats.record("SELECT * FROM yt_model_forecast", 0.0, 0.1, 0.2, 5000, error=True)
+        stats.record("SELECT * FROM yt_group", 0.0, 0.1, 0.0, 3)
+        stats.record("SELECT * FROM yt_license", 0.0, 0.1, 0.0, 3)
+
+    top = stats.top(limit=10)
+    assert [row["query"] for row in top] == ["SELECT * FROM yt_role WHERE id = $1", "SELECT * FROM yt_model_forecast",
+                                             "other"]
+    role = top[0]
+    assert role["calls"] == 10 and role["rows"] == 10
+    assert role["p50_seconds"] == 0.005 and role["p99_seconds"] == 2.0
+    assert top[1]["errors"] == 1 and top[2]["calls"] == 2
+    assert stats.slow_queries == 1 and "Slow query" in caplog.text
+
+# ### QUERY STATS ###
@@ -0,0 +1,95 @@
+import asyncio
+import itertools
+import time
+import timeit
+
+import pytest
+
+from core.scopes.set_scope import ROLE_HIERARCHY, Role, is_authorized, role_mask, scope_mask
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_scopes.py
+# TO RUN THE AUTHORIZATION MICRO-BENCHMARK, get_current_user needs the app's env variables
+# python -m tests.test_scopes
+
+
+ROLE_NAMES = [role['name'] for role in ROLE_HIERARCHY]
+
+
+# List based authorization that get_current_user used before the bitmasks
+def legacy_assign_scopes(scopes):
+    if Role.SUPER_ADMIN['name'] in scopes:
+        scopes = [Role.SUPER_ADMIN['name'], Role.ADMIN['name'], Role.MANAGER['name'], Role.USER['name'], Role.REPORTING_USER['name']]
+    elif Role.ADMIN['name'] in scopes:
+        scopes = [Role.ADMIN['name'], Role.MANAGER['name'], Role.USER['name'], Role.REPORTING_USER['name']]
+    elif Role.MANAGER['name'] in scopes:
+        scopes = [Role.MANAGER['name'], Role.USER['name'], Role.REPORTING_USER['name']]
+    elif Role.USER['name'] in scopes:
+        scopes = [Role.USER['name'], Role.REPORTING_USER['name']]
+    elif Role.REPORTING_USER['name'] in scopes:
+        scopes = [Role.REPORTING_USER['name']]
+    return scopes
+
+
+def legacy_is_authorized(role_name, required_scopes):
+    granted = legacy_assign_scopes([str(role_name).upper()])
+    return all(scope in granted for scope in required_scopes)
+
+
+def compiled_is_authorized(role_name, required_scopes):
+    return is_authorized(role_mask(role_name), scope_mask(tuple(required_scopes)))
+
+
+# ### SCOPES ###
+@pytest.mark.parametrize("role_name", ROLE_NAMES + ["manager", "UNKNOWN"])
+def test_bitmask_matches_legacy_authorization(role_name):
+    for size in range(len(ROLE_NAMES) + 1):
+        for required in itertools.combinations(ROLE_NAMES + ["NOT_A_SCOPE"], size):
+            assert compiled_is_authorized(role_name, required) == legacy_is_authorized(role_name, required)
+
+# ### SCOPES ###
+
+
+def benchmark(number=200000):
+    required = [Role.REPORTING_USER['name']]
+    for role_name in (Role.REPORTING_USER['name'], Role.SUPER_ADMIN['name']):
+        legacy = timeit.timeit(lambda: legacy_is_authorized(role_name, required), number=number)
+        compiled = timeit.timeit(lambda: compiled_is_authorized(role_name, required), number=number)
+        print(f"{role_name:>15}: legacy {legacy / number * 1e9:7.1f} ns  "
+              f"bitmask {compiled / number * 1e9:7.1f} ns  ({legacy / compiled:.1f}x)")
+
+
+# Whole get_current_user per request, principal and revisions served from the principal cache
+def benchmark_get_current_user(number=20000):
+    from fastapi.security import SecurityScopes
+    import internal.Token as Token
+
+    principal = {"id": 1, "first_name": "Bench", "last_name": "Mark", "username": "bench", "email": "bench@mark.io",
+                 "group_id": 1, "role_id": 1, "license_id": 1, "role_name": Role.ADMIN['name']}
+    Token.principal_cache.set(principal["id"], [principal])
+    Token.principal_cache.set(("revisions", principal["id"]), (0, 0))
+    Token.STATELESS_AUTH = True
+    scopes = SecurityScopes([Role.REPORTING_USER['name']])
+
+    access = Token.create_access_token({"sub": "bench", "id": 1}, token_type="access")
+    stateless = Token.create_access_token({"sub": "bench", "id": 1, "mode": "stateless", "ver": Token.TOKEN_VERSION,
+                                           "rev": [0, 0], "usr": principal}, token_type="stateless")
+
+    async def run(token, cold):
+        started = time.perf_counter()
+        for _ in range(number):
+            if cold:
+                Token.verified_tokens.clear()
+            await Token.get_current_user(scopes, token)
+        return time.perf_counter() - started
+
+    for name, token, cold in (("access, cold", access, True), ("access", access, False),
+                              ("stateless", stateless, False)):
+        seconds = asyncio.run(run(token, cold))
+        print(f"get_current_user {name:>12}: {seconds / number * 1e6:7.2f} us")
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_get_current_user()
@@ -0,0 +1,93 @@
+import asyncio
+
+from core.models.db import Database, SingleFlight, copy_rows, is_read_query
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_singleflight.py
+
+
+# ### SINGLE FLIGHT ###
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def query(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return [{"id": key}]
+
+    async def scenario():
+        group = SingleFlight()
+        results = await asyncio.gather(*(group.run(("q", 1), query, 1, copy=copy_rows) for _ in range(50)),
+                                       group.run(("q", 2), query, 2))
+        # Finished executions are not reused
+        again = await group.run(("q", 1), query, 1)
+        return results, again, group.stats()
+
+    results, again, stats = asyncio.run(scenario())
+    assert calls == [1, 2, 1]
+    assert all(result == [{"id": 1}] for result in results[:50]) and results[50] == [{"id": 2}]
+    # Every caller that joined got its own rows
+    assert len({id(result[0]) for result in results[:50]}) == 50
+    assert again == [{"id": 1}]
+    assert stats["executions"] == 3 and stats["shared"] == 49 and stats["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_execution():
+    async def query():
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def scenario():
+        group = SingleFlight()
+        first = asyncio.ensure_future(group.run("q", query))
+        second = asyncio.ensure_future(group.run("q", query))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_only_reads_are_shared():
+    assert is_read_query("  select * from yt_role")
+    assert is_read_query("WITH x AS (SELECT 1) SELECT * FROM x")
+    assert not is_read_query("UPDATE yt_role SET role_name = $1")
+
+
+class FakeConnection:
+    def __init__(self, statements):
+        self.statements = statements
+
+    async def fetch_prepared(self, query, *args):
+        self.statements.append(query.split()[0])
+        # The read is still running when the write has finished
+        await asyncio.sleep(0.05 if is_read_query(query) else 0)
+        return []
+
+
+class FakePool:
+    def __init__(self):
+        self.statements = []
+
+    async def acquire(self, timeout=None):
+        return FakeConnection(self.statements)
+
+    async def release(self, con):
+        pass
+
+
+def test_read_after_write_does_not_join_earlier_read():
+    database = Database("user", "password", "host", "database", 5432)
+    database._connection_pool = FakePool()
+
+    async def scenario():
+        before = asyncio.ensure_future(database.execute_query("SELECT * FROM yhat_db.yt_role"))
+        await asyncio.sleep(0.01)
+        await database.execute_query("UPDATE yhat_db.yt_role SET role_name = $1", "admin")
+        await asyncio.gather(before, database.execute_query("SELECT * FROM yhat_db.yt_role"))
+
+    asyncio.run(scenario())
+    assert database._connection_pool.statements == ["SELECT", "UPDATE", "SELECT"]
+
+# ### SINGLE FLIGHT ###
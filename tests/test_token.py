@@ -0,0 +1,141 @@
+import asyncio
+import base64
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import SecurityScopes
+from jose import ExpiredSignatureError, JWTError, jwt
+
+import internal.cache
+import internal.Token as Token
+from core.models.database import database
+from core.scopes.set_scope import Role
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_token.py
+
+
+PRINCIPAL = {"id": 1, "first_name": "Test", "last_name": "User", "username": "test", "group_id": 1, "role_id": 1,
+             "license_id": 1, "role_name": Role.ADMIN['name']}
+
+
+# Revision rows as TABLE_PRINCIPAL_REVISION returns them, None fails every read and write
+def revision_table(monkeypatch, rows):
+    statements = []
+
+    async def execute_query(query, *args, **kwargs):
+        statements.append(query)
+        return rows
+
+    monkeypatch.setattr(database, "execute_query", execute_query)
+    Token.principal_cache.clear()
+    return statements
+
+
+def stateless_payload(rev):
+    return {"sub": "test", "id": 1, "mode": "stateless", "ver": Token.TOKEN_VERSION, "rev": rev, "usr": PRINCIPAL}
+
+
+# ### TOKENS ###
+@pytest.mark.parametrize("rows, rev, revoked", [
+    ([], [0, 0], False),
+    ([{"principal_id": 0, "revision": 2}, {"principal_id": 1, "revision": 3}], [2, 3], False),
+    ([{"principal_id": 1, "revision": 1}], [0, 0], True),
+    ([{"principal_id": 0, "revision": 1}], [0, 0], True),
+    # Revisions that cannot be read revoke the token
+    (None, [0, 0], True),
+])
+def test_is_revoked(monkeypatch, rows, rev, revoked):
+    revision_table(monkeypatch, rows)
+
+    assert asyncio.run(Token.is_revoked(stateless_payload(rev))) == revoked
+
+
+def test_is_revoked_rejects_other_token_versions(monkeypatch):
+    revision_table(monkeypatch, [])
+
+    assert asyncio.run(Token.is_revoked({**stateless_payload([0, 0]), "ver": Token.TOKEN_VERSION + 1}))
+
+
+def test_revoked_stateless_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(Token, "STATELESS_AUTH", True)
+    revision_table(monkeypatch, [{"principal_id": 1, "revision": 1}])
+    scopes = SecurityScopes([Role.REPORTING_USER['name']])
+
+    current = Token.create_access_token(stateless_payload([0, 1]), token_type="stateless")
+    revoked = Token.create_access_token(stateless_payload([0, 0]), token_type="stateless")
+
+    assert asyncio.run(Token.get_current_user(scopes, current))["id"] == 1
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(Token.get_current_user(scopes, revoked))
+    assert error.value.status_code == 401
+
+
+def test_revoke_evicts_principal_when_revision_write_fails(monkeypatch):
+    monkeypatch.setattr(Token, "STATELESS_AUTH", True)
+    revision_table(monkeypatch, None)
+    Token.principal_cache.set(1, [PRINCIPAL])
+
+    with pytest.raises(Token.RevocationError):
+        asyncio.run(Token.revoke_principal(1))
+    assert Token.principal_cache.get(1) is None
+
+
+def test_revoke_writes_no_revision_without_stateless_auth(monkeypatch):
+    monkeypatch.setattr(Token, "STATELESS_AUTH", False)
+    statements = revision_table(monkeypatch, None)
+    Token.principal_cache.set(1, [PRINCIPAL])
+
+    asyncio.run(Token.revoke_principal(1))
+    asyncio.run(Token.revoke_all_principals())
+    assert Token.principal_cache.get(1) is None
+    assert statements == []
+
+
+def test_verified_token_is_cached_until_it_expires(monkeypatch):
+    Token.verified_tokens.clear()
+    token = jwt.encode({"sub": "test", "id": 1, "exp": int(time.time()) + 60}, Token.SECRET_KEY,
+                       algorithm=Token.ALGORITHM)
+    now = time.monotonic()
+    payload = Token.decode_token(token)
+
+    # From here on the clock is past exp for jwt.decode
+    decoded = []
+
+    def expired(token, key, algorithms):
+        decoded.append(token)
+        raise ExpiredSignatureError("Signature has expired.")
+
+    monkeypatch.setattr(Token.jwt, "decode", expired)
+    monkeypatch.setattr(internal.cache, "time", SimpleNamespace(monotonic=lambda: now + 55))
+    assert Token.decode_token(token) == payload and decoded == []
+
+    # Past exp the cached payload is dropped and the token is verified again
+    monkeypatch.setattr(internal.cache, "time", SimpleNamespace(monotonic=lambda: now + 61))
+    with pytest.raises(ExpiredSignatureError):
+        Token.decode_token(token)
+    assert decoded == [token]
+
+
+def test_tampered_token_misses_the_cache():
+    Token.verified_tokens.clear()
+    token = Token.create_access_token({"sub": "test", "id": 1}, token_type="access")
+    Token.decode_token(token)
+
+    header, claims, signature = token.split(".")
+    forged = json.dumps({**jwt.get_unverified_claims(token), "id": 2}).encode()
+    forged_claims = base64.urlsafe_b64encode(forged).rstrip(b"=").decode()
+
+    for tampered in (f"{header}.{forged_claims}.{signature}", f"{header}.{claims}.{signature[:-2]}AA"):
+        with pytest.raises(JWTError):
+            Token.decode_token(tampered)
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(Token.get_current_user(SecurityScopes(), tampered))
+        assert error.value.status_code == 401
+    assert len(Token.verified_tokens) == 1
+
+# ### TOKENS ###
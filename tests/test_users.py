@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from httpx import AsyncClient
+
+import main
+from core.models.database import database
+from internal.executors import password_hasher
+from internal.Token import get_current_active_user
+
+
+# TO RUN THESE TESTS USING PYTEST
+# pytest tests/test_users.py
+
+
+def user(username, email):
+    return {"first_name": "First", "last_name": "Last", "email": email, "username": username,
+            "password": "Secret123!", "group_id": 1, "role_id": 1, "license_id": 1}
+
+
+# yt_user holding `existing` (username, email) rows, the inserted users are appended to it
+def user_table(monkeypatch, existing, duplicate_ids=()):
+    rows = [{"id": index + 1, "username": username, "email": email} for index, (username, email) in enumerate(existing)]
+    inserts = []
+
+    async def execute_in_list(build_query, values, *args, cache=False, con=None):
+        query = build_query("$1")
+        if query.startswith("SELECT username"):
+            return [{"username": row["username"]} for row in rows if row["username"] in values]
+        if query.startswith("SELECT email"):
+            return [{"email": row["email"]} for row in rows if row["email"] in values]
+        found = [{"id": row["id"], "username": row["username"]} for row in rows if row["username"] in values]
+        return found + [{"id": 100, "username": username} for username in duplicate_ids]
+
+    async def insert_many(table, columns, records, schema=None, con=None):
+        inserts.append((table, records))
+        if table == "yt_user":
+            rows.extend({"id": len(rows) + 1, "username": record[4], "email": record[3]} for record in records)
+        return len(records)
+
+    @asynccontextmanager
+    async def transaction():
+        yield object()
+
+    async def hash_many(passwords):
+        return ["hash"] * len(passwords)
+
+    monkeypatch.setattr(database, "execute_in_list", execute_in_list)
+    monkeypatch.setattr(database, "insert_many", insert_many)
+    monkeypatch.setattr(database, "transaction", transaction)
+    monkeypatch.setattr(password_hasher, "hash_many", hash_many)
+    monkeypatch.setitem(main.app.dependency_overrides, get_current_active_user, lambda: None)
+    return inserts
+
+
+def post(url, json):
+    async def request():
+        async with AsyncClient(app=main.app, base_url="http://test") as client:
+            return await client.post(url, json=json)
+
+    return asyncio.run(request())
+
+
+def post_bulk(records):
+    return post("/user/create/bulk/", records)
+
+
+# ### USERS ###
+def test_bulk_create_reports_row_errors(monkeypatch):
+    inserts = user_table(monkeypatch, [("taken", "taken@mail.io")])
+
+    response = post_bulk([user("new", "new@mail.io"), user("NEW", "other@mail.io"), user("other", "new@mail.io"),
+                          user("taken", "free@mail.io"), user("free", "taken@mail.io"), user("second", "second@mail.io")])
+
+    assert response.status_code == 201
+    body = response.json()
+    assert [(created["username"], created["id"]) for created in body["created"]] == [("new", 2), ("second", 3)]
+    assert body["errors"] == [
+        {"index": 1, "username": "new", "detail": "Duplicate username in request"},
+        {"index": 2, "username": "other", "detail": "Duplicate email in request"},
+        {"index": 3, "username": "taken", "detail": "Username already exists"},
+        {"index": 4, "username": "free", "detail": "Email already exists"},
+    ]
+    assert [(table, len(records)) for table, records in inserts] == [("yt_user", 2), ("yt_user_system_description", 2)]
+    assert [record[0] for record in inserts[1][1]] == [2, 3]
+
+
+def test_bulk_create_rejects_usernames_without_a_single_id(monkeypatch):
+    inserts = user_table(monkeypatch, [], duplicate_ids=["new"])
+
+    response = post_bulk([user("new", "new@mail.io")])
+
+    assert response.status_code == 409
+    assert [table for table, _ in inserts] == ["yt_user"]
+
+
+def test_create_answers_503_while_the_hasher_is_full(monkeypatch):
+    monkeypatch.setattr(password_hasher, "queue_limit", 0)
+    monkeypatch.setitem(main.app.dependency_overrides, get_current_active_user, lambda: None)
+    rejected = password_hasher.rejected
+
+    response = post("/user/create/", user("new", "new@mail.io"))
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    async def request():
+        async with AsyncClient(app=main.app, base_url="http://test") as client:
+            return await client.get("/admin/executors/")
+
+    assert asyncio.run(request()).json()["password_hasher"]["rejected"] == rejected + 1
+
+# ### USERS ###